@@ -1,15 +1,55 @@
+import os
 import tensorflow as tf
-import numpy as np # Lo useremo se decidiamo di fare quantizzazione INT8
+import numpy as np
+from export_firmware import export_firmware_files
+from model_runtime import write_model_metadata
+from model_conversion import split_early_exit_model, convert_to_int8, NUM_CALIBRATION_IMAGES
 
 # --- Parametri ---
 KERAS_MODEL_PATH = "hand_gesture_model.keras"  # Percorso al modello Keras salvato
 TFLITE_MODEL_PATH = "hand_gesture_model.tflite" # Nome del file per il modello TFLite
+# Genera anche l'array C (.h/.cpp) con arena e operatori per lo sketch ESP32 (vedi export_firmware.py)
+EXPORT_FIRMWARE_FILES = True
+# Quantizzazione INT8 completa (pesi, attivazioni, input e output int8): la massima riduzione di dimensioni
+# e la migliore velocità su microcontrollore. Richiede le immagini di calibrazione da PREPROCESSED_DATA_FILE.
+QUANTIZE_INT8 = False
 
-# Opzionale: per la quantizzazione INT8, avremo bisogno di un piccolo subset dei dati di training
-# PREPROCESSED_DATA_FILE = "preprocessed_dataset.npz" # Se vuoi fare quantizzazione INT8
-# NUM_CALIBRATION_IMAGES = 100 # Numero di immagini da usare per la calibrazione INT8
+# Modello early exit (train_model.py con EARLY_EXIT = True): se presente viene esportato come due modelli
+# TFLite invocabili separatamente. Il primo restituisce la predizione anticipata e le feature del primo
+# blocco; il secondo, eseguito solo se la confidenza anticipata è bassa, parte da quelle feature.
+EARLY_EXIT_MODEL_PATH = "hand_gesture_model_early_exit.keras"
+EARLY_EXIT_STEM_TFLITE_PATH = "hand_gesture_model_exit1.tflite"
+EARLY_EXIT_TAIL_TFLITE_PATH = "hand_gesture_model_exit2.tflite"
+
+# Da qui si leggono classi e dimensioni per il file di metadati del modello (hand_gesture_model.json).
+# Per la quantizzazione INT8 serve anche un piccolo subset dei dati di training
+PREPROCESSED_DATA_FILE = "preprocessed_dataset.npz"
+# (il numero di immagini di calibrazione, NUM_CALIBRATION_IMAGES, è in model_conversion.py)
 # --- Fine Parametri ---
 
+def load_calibration_images():
+    """Carica il subset dei dati di training usato per calibrare la quantizzazione INT8 (None se non disponibile)."""
+    try:
+        with np.load(PREPROCESSED_DATA_FILE) as data:
+            return data['train_images'][:NUM_CALIBRATION_IMAGES]
+    except FileNotFoundError:
+        print(f"ERRORE: File {PREPROCESSED_DATA_FILE} non trovato. Necessario per la calibrazione INT8.")
+        print("Assicurati di aver eseguito prima lo script di pre-elaborazione.")
+    except KeyError:
+        print(f"ERRORE: 'train_images' non trovate in {PREPROCESSED_DATA_FILE}. Necessario per la calibrazione INT8.")
+    return None
+
+def convert_early_exit_models():
+    """Converte il modello early exit nei due modelli TFLite (stem con uscita anticipata e tail)."""
+    print(f"\nConversione del modello early exit da: {EARLY_EXIT_MODEL_PATH}")
+    model = tf.keras.models.load_model(EARLY_EXIT_MODEL_PATH)
+    stem, tail = split_early_exit_model(model)
+    for keras_model, tflite_path in [(stem, EARLY_EXIT_STEM_TFLITE_PATH), (tail, EARLY_EXIT_TAIL_TFLITE_PATH)]:
+        tflite_model = tf.lite.TFLiteConverter.from_keras_model(keras_model).convert()
+        with open(tflite_path, 'wb') as f:
+            f.write(tflite_model)
+        print(f"  Salvato {tflite_path} ({len(tflite_model) / 1024:.2f} KB)")
+
 def main():
     # Carica il modello Keras addestrato
     print(f"Caricamento del modello Keras da: {KERAS_MODEL_PATH}")
@@ -47,45 +87,25 @@ def main():
     # converter.optimizations = [tf.lite.Optimize.DEFAULT]
     # converter.target_spec.supported_types = [tf.float16]
 
-    # 4. Quantizzazione Intera (INT8) - Massima ottimizzazione per TinyML (Più Complessa)
-    # Converte pesi e attivazioni in interi a 8-bit. Richiede un dataset rappresentativo per la calibrazione.
-    # Questa offre la maggiore riduzione delle dimensioni e spesso la migliore accelerazione su hardware compatibile.
-    # print("\nApplicazione della quantizzazione INT8 completa...")
-    # converter.optimizations = [tf.lite.Optimize.DEFAULT] # Abilita la quantizzazione
-
-    # # Carica un subset dei dati di training per la calibrazione
-    # try:
-    #     with np.load(PREPROCESSED_DATA_FILE) as data:
-    #         calibration_images = data['train_images'][:NUM_CALIBRATION_IMAGES]
-    #     print(f"Usate {len(calibration_images)} immagini per la calibrazione INT8.")
-    # except FileNotFoundError:
-    #     print(f"ERRORE: File {PREPROCESSED_DATA_FILE} non trovato. Necessario per la calibrazione INT8.")
-    #     print("Assicurati di aver eseguito prima lo script di pre-elaborazione.")
-    #     return
-    # except KeyError:
-    #     print(f"ERRORE: 'train_images' non trovate in {PREPROCESSED_DATA_FILE}. Necessario per la calibrazione INT8.")
-    #     return
-
-    # def representative_dataset_gen():
-    #     for value in calibration_images:
-    #         # Ogni 'value' è un'immagine, deve essere wrappata in una lista e avere il tipo corretto
-    #         yield [np.array(value, dtype=np.float32)] # TensorFlow si aspetta un float32 per il dataset rappresentativo
-
-    # converter.representative_dataset = representative_dataset_gen
-    # # Forza l'input e l'output del modello TFLite a essere interi (comune per microcontrollori)
-    # converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
-    # converter.inference_input_type = tf.int8  # o tf.uint8
-    # converter.inference_output_type = tf.int8 # o tf.uint8
+    # 4. Quantizzazione Intera (INT8): impostare QUANTIZE_INT8 = True nei parametri
+    # (usa convert_to_int8 di model_conversion.py, lo stesso percorso del confronto PTQ/QAT in train_model.py)
     # --- Fine Opzioni di Ottimizzazione ---
 
     # Esegui la conversione
     try:
-        tflite_model = converter.convert()
+        if QUANTIZE_INT8:
+            calibration_images = load_calibration_images()
+            if calibration_images is None:
+                return
+            print(f"\nApplicazione della quantizzazione INT8 completa ({len(calibration_images)} immagini di calibrazione)...")
+            tflite_model = convert_to_int8(model, calibration_images)
+        else:
+            tflite_model = converter.convert()
         print("\nConversione in TensorFlow Lite completata.")
     except Exception as e:
         print(f"ERRORE durante la conversione in TensorFlow Lite: {e}")
         # Se usi la quantizzazione INT8 e fallisce, spesso è un problema con
-        # il representative_dataset_gen o con operatori non supportati per INT8.
+        # le immagini di calibrazione o con operatori non supportati per INT8.
         return
 
     # Salva il modello TFLite su file
@@ -94,5 +114,23 @@ def main():
     print(f"Modello TensorFlow Lite salvato come: {TFLITE_MODEL_PATH}")
     print(f"Dimensioni del modello TFLite: {len(tflite_model) / 1024:.2f} KB")
 
+    # File di metadati accanto al modello (classi e dimensioni input), letto da test_tflite_model.py
+    # senza dover aprire il dataset pre-elaborato
+    try:
+        with np.load(PREPROCESSED_DATA_FILE) as data:
+            write_model_metadata(TFLITE_MODEL_PATH, data['class_names'],
+                                 int(data['img_height'][0]), int(data['img_width'][0]))
+    except (FileNotFoundError, KeyError) as e:
+        print(f"ATTENZIONE: impossibile scrivere i metadati del modello ({e}).")
+
+    if EXPORT_FIRMWARE_FILES:
+        export_firmware_files(tflite_model)
+
+    if os.path.exists(EARLY_EXIT_MODEL_PATH):
+        try:
+            convert_early_exit_models()
+        except Exception as e:
+            print(f"ERRORE durante la conversione del modello early exit: {e}")
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,216 @@
+import cv2
+import os
+import shutil
+import time
+import numpy as np
+from collections import defaultdict
+
+# --- Parametri ---
+DATASET_PATH = "dataset"                 # Cartella principale contenente le sottocartelle delle classi
+DUPLICATES_PATH = "dataset_duplicates"   # Dove vengono spostati i quasi-duplicati in modalità "remove"
+CLASS_NAMES = ["mano_alzata", "mano_abbassata"]
+
+# "flag": stampa solo i gruppi di quasi-duplicati trovati
+# "remove": sposta le immagini ridondanti in DUPLICATES_PATH/<data_ora>/<classe> (operazione reversibile).
+#           Ogni esecuzione usa una propria sottocartella: data_collector.py riusa i nomi liberi
+#           (gesto_NNNN.png), quindi un'immagine spostata in un'esecuzione precedente può avere lo stesso nome.
+DEDUP_MODE = "flag"
+
+# Due immagini sono quasi-duplicate se i loro hash percettivi (dHash a 64 bit) differiscono al massimo
+# di HAMMING_THRESHOLD bit. Con 64 bit, 0-5 indica frame praticamente identici.
+HAMMING_THRESHOLD = 4
+# --- Fine Parametri ---
+
+HASH_BITS = 64
+
+
+def compute_dhash(gray_image):
+    """
+    Difference hash a 64 bit: riduce l'immagine a 9x8 e confronta ogni pixel con il vicino a destra.
+    Accetta un'immagine in scala di grigi (uint8 o float), quindi anche quelle già pre-elaborate.
+    """
+    small = cv2.resize(np.asarray(gray_image, dtype=np.float32), (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(hash_a, hash_b):
+    return bin(hash_a ^ hash_b).count("1")
+
+
+def find_near_duplicate_groups(hashes, threshold=HAMMING_THRESHOLD):
+    """
+    Raggruppa gli hash quasi-duplicati (distanza di Hamming <= threshold).
+    Indice multi-banda: l'hash è diviso in threshold + 1 bande; per il principio dei cassetti due hash
+    entro la soglia hanno almeno una banda identica, quindi si confrontano solo i candidati che
+    condividono una banda invece di tutte le coppie.
+    Restituisce un array con l'id di gruppo di ogni hash (gli elementi unici hanno un gruppo tutto loro).
+    """
+    num_bands = threshold + 1
+    band_bits = HASH_BITS // num_bands
+    band_mask = (1 << band_bits) - 1
+
+    parent = list(range(len(hashes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    buckets = defaultdict(list)
+    for i, image_hash in enumerate(hashes):
+        candidates = set()
+        for band in range(num_bands):
+            key = (band, (image_hash >> (band * band_bits)) & band_mask)
+            candidates.update(buckets[key])
+            buckets[key].append(i)
+        for j in candidates:
+            if hamming_distance(image_hash, hashes[j]) <= threshold:
+                parent[find(i)] = find(j)
+
+    return np.array([find(i) for i in range(len(hashes))])
+
+
+def leader_clusters(hashes, groups, threshold=HAMMING_THRESHOLD):
+    """
+    I gruppi sono catene (A~B, B~C), quindi A e C possono essere molto diverse e un movimento lento
+    produce un'unica catena enorme. Ogni catena viene divisa in cluster a raggio limitato: un'immagine
+    diventa "leader" se dista più di 'threshold' da tutti i leader già scelti, altrimenti si unisce al
+    leader più vicino. Restituisce (id del cluster di ogni hash, True per i leader).
+    Serve solo a scegliere quali file tenere: due quasi-duplicati possono finire in cluster diversi,
+    quindi per dividere training/validazione vanno usati i gruppi di find_near_duplicate_groups.
+    """
+    clusters = np.arange(len(hashes))
+    is_leader = np.ones(len(hashes), dtype=bool)
+    members = defaultdict(list)
+    for index, group in enumerate(groups):
+        members[group].append(index)
+
+    for indices in members.values():
+        leaders = []
+        for i in indices:
+            distances = [hamming_distance(hashes[i], hashes[k]) for k in leaders]
+            if not distances or min(distances) > threshold:
+                leaders.append(i)
+            else:
+                clusters[i] = leaders[int(np.argmin(distances))]
+                is_leader[i] = False
+    return clusters, is_leader
+
+
+def near_duplicate_groups_per_class(images, labels, threshold=HAMMING_THRESHOLD):
+    """
+    Id di gruppo globali per immagini già caricate: i quasi-duplicati vengono cercati solo all'interno
+    della stessa classe. Usato da preprocess_data.py per tenere ogni gruppo nello stesso split.
+    I gruppi sono le componenti connesse complete (catene comprese): è l'unico modo per garantire che
+    nessuna coppia entro la soglia finisca a cavallo tra training e validazione.
+    """
+    groups = np.zeros(len(labels), dtype=np.int64)
+    next_group = 0
+    for label in np.unique(labels):
+        indices = np.flatnonzero(labels == label)
+        hashes = [compute_dhash(np.squeeze(images[i])) for i in indices]
+        _, class_groups = np.unique(find_near_duplicate_groups(hashes, threshold), return_inverse=True)
+        groups[indices] = class_groups + next_group
+        next_group += class_groups.max() + 1
+    return groups
+
+
+def select_redundant(paths, hashes, groups, threshold=HAMMING_THRESHOLD):
+    """
+    Tiene solo il leader di ogni cluster (vedi leader_clusters), così non si perdono i frame intermedi
+    di un movimento lento. Restituisce (lista di (leader, duplicati), percorsi ridondanti).
+    """
+    clusters, is_leader = leader_clusters(hashes, groups, threshold)
+    duplicates_of = defaultdict(list)
+    for i in np.flatnonzero(~is_leader):
+        duplicates_of[clusters[i]].append(paths[i])
+    duplicate_groups = [(paths[leader], duplicates) for leader, duplicates in duplicates_of.items()]
+    redundant = [path for _, duplicates in duplicate_groups for path in duplicates]
+    return duplicate_groups, redundant
+
+
+def scan_class(class_path):
+    """
+    Calcola gli hash di tutte le immagini di una classe, ordinate per data di modifica (e poi per nome),
+    così il leader è il frame più vecchio anche quando data_collector.py ha riusato un indice libero.
+    """
+    paths, hashes = [], []
+    img_files = sorted(os.listdir(class_path),
+                       key=lambda name: (os.path.getmtime(os.path.join(class_path, name)), name))
+    for img_file in img_files:
+        img_path = os.path.join(class_path, img_file)
+        img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            print(f"  ATTENZIONE: Impossibile leggere l'immagine {img_path}. Salto.")
+            continue
+        paths.append(img_path)
+        hashes.append(compute_dhash(img))
+    return paths, hashes
+
+
+def unique_destination(target_dir, file_name):
+    """Percorso in target_dir per file_name che non sovrascrive un file esistente (aggiunge _1, _2, ...)."""
+    destination = os.path.join(target_dir, file_name)
+    stem, extension = os.path.splitext(file_name)
+    suffix = 1
+    while os.path.exists(destination):
+        destination = os.path.join(target_dir, f"{stem}_{suffix}{extension}")
+        suffix += 1
+    return destination
+
+
+def main():
+    print(f"Ricerca di quasi-duplicati in '{DATASET_PATH}' (soglia di Hamming: {HAMMING_THRESHOLD} bit su {HASH_BITS})")
+    total_images = total_duplicates = 0
+    total_bytes = duplicate_bytes = 0
+    # Sottocartella propria di questa esecuzione: i file spostati in precedenza non vengono mai toccati
+    run_duplicates_path = os.path.join(DUPLICATES_PATH, time.strftime("%Y%m%d_%H%M%S"))
+
+    for class_name in CLASS_NAMES:
+        class_path = os.path.join(DATASET_PATH, class_name)
+        if not os.path.isdir(class_path):
+            print(f"ATTENZIONE: La cartella per la classe '{class_name}' non è stata trovata in '{DATASET_PATH}'. Salto.")
+            continue
+
+        paths, hashes = scan_class(class_path)
+        groups = find_near_duplicate_groups(hashes)
+        duplicate_groups, duplicates = select_redundant(paths, hashes, groups)
+
+        class_bytes = sum(os.path.getsize(p) for p in paths)
+        class_duplicate_bytes = sum(os.path.getsize(p) for p in duplicates)
+        total_images += len(paths)
+        total_duplicates += len(duplicates)
+        total_bytes += class_bytes
+        duplicate_bytes += class_duplicate_bytes
+
+        print(f"\nClasse '{class_name}': {len(paths)} immagini, {len(duplicate_groups)} gruppi di quasi-duplicati, "
+              f"{len(duplicates)} immagini ridondanti")
+        for kept, redundant in duplicate_groups:
+            print(f"  Tengo {os.path.basename(kept)}, duplicati: {', '.join(os.path.basename(p) for p in redundant)}")
+
+        if DEDUP_MODE == "remove" and duplicates:
+            target_dir = os.path.join(run_duplicates_path, class_name)
+            os.makedirs(target_dir, exist_ok=True)
+            for path in duplicates:
+                shutil.move(path, unique_destination(target_dir, os.path.basename(path)))
+            print(f"  Spostate {len(duplicates)} immagini in: {target_dir}")
+
+    if total_images == 0:
+        print("ERRORE: Nessuna immagine trovata. Controlla DATASET_PATH e i nomi delle classi.")
+        return
+
+    remaining = total_images - total_duplicates
+    print(f"\nRiepilogo: {total_images} -> {remaining} immagini "
+          f"(-{total_duplicates / total_images * 100:.1f}%), "
+          f"{total_bytes / 1024 / 1024:.2f} -> {(total_bytes - duplicate_bytes) / 1024 / 1024:.2f} MB su disco")
+    print(f"preprocessed_dataset.npz e il tempo per epoca di model.fit scendono a circa il {remaining / total_images * 100:.0f}%.")
+    if DEDUP_MODE == "remove":
+        print("Riesegui preprocess_data.py per rigenerare il dataset pre-elaborato.")
+    else:
+        print("Modalità 'flag': nessun file modificato. Imposta DEDUP_MODE = \"remove\" per compattare il dataset.")
+
+
+if __name__ == '__main__':
+    main()
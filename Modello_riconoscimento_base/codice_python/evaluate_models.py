@@ -0,0 +1,193 @@
+import os
+import time
+import numpy as np
+import tensorflow as tf
+from model_runtime import from_float, to_float, split_stem_outputs
+
+# --- Parametri ---
+PREPROCESSED_DATA_FILE = "preprocessed_dataset.npz"
+KERAS_MODEL_PATH = "hand_gesture_model.keras"
+# Modelli TFLite da valutare (float32 o int8); quelli non presenti su disco vengono saltati
+TFLITE_MODEL_PATHS = ["hand_gesture_model.tflite",
+                      "hand_gesture_model_ptq_int8.tflite", "hand_gesture_model_qat_int8.tflite"]  # int8: train_model.py con QAT_FINE_TUNE
+
+EVAL_BATCH_SIZE = 256      # L'input dell'interprete viene ridimensionato a questo batch
+MAX_ACCURACY_DROP = 0.01   # Calo massimo di accuracy (1 punto percentuale) tollerato dopo la conversione
+
+# Modello early exit esportato da convert_to_tflite.py (valutato solo se presente)
+EARLY_EXIT_STEM_TFLITE_PATH = "hand_gesture_model_exit1.tflite"
+EARLY_EXIT_TAIL_TFLITE_PATH = "hand_gesture_model_exit2.tflite"
+# Soglie di confidenza della testa anticipata per cui mostrare il compromesso uscite anticipate / accuracy
+EARLY_EXIT_THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99]
+# --- Fine Parametri ---
+
+
+def load_validation_data(file_path):
+    """Carica solo le immagini/etichette di validazione e i nomi delle classi."""
+    print(f"Caricamento dati di validazione da: {file_path}")
+    with np.load(file_path) as data:
+        val_images = data['val_images']
+        val_labels = data['val_labels']
+        class_names = [str(name) for name in data['class_names']]
+    print(f"  Immagini di validazione: {val_images.shape}, classi: {class_names}")
+    return val_images, val_labels, class_names
+
+
+def compute_metrics(true_labels, predicted_labels, num_classes):
+    """Calcola accuracy, matrice di confusione e precision/recall per classe."""
+    confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+    np.add.at(confusion, (true_labels, predicted_labels), 1)
+    true_positives = np.diag(confusion).astype(np.float64)
+    # np.maximum evita divisioni per zero se una classe non viene mai predetta/non compare
+    precision = true_positives / np.maximum(confusion.sum(axis=0), 1)
+    recall = true_positives / np.maximum(confusion.sum(axis=1), 1)
+    accuracy = true_positives.sum() / max(len(true_labels), 1)
+    return {'accuracy': accuracy, 'confusion': confusion, 'precision': precision, 'recall': recall}
+
+
+def run_tflite_batches(model_path, inputs, batch_size=EVAL_BATCH_SIZE):
+    """
+    Esegue il modello TFLite su tutti gli input a batch di 'batch_size'.
+    Restituisce (lista degli output in float, uno per tensore di output, dettagli degli output, input al secondo).
+    La velocità conta solo le inferenze: ridimensionamento e primo invoke (inizializzazione di XNNPACK)
+    sono fuori dalla misura, come il riscaldamento di predict_keras.
+    """
+    interpreter = tf.lite.Interpreter(model_path=model_path)
+
+    def allocate(size):
+        """Ridimensiona l'input a 'size' immagini ed esegue un invoke a vuoto non cronometrato."""
+        input_index = interpreter.get_input_details()[0]['index']
+        interpreter.resize_tensor_input(input_index, [size, *inputs.shape[1:]])
+        interpreter.allocate_tensors()
+        # I dettagli vanno riletti dopo il ridimensionamento
+        detail = interpreter.get_input_details()[0]
+        interpreter.set_tensor(detail['index'], np.zeros(detail['shape'], dtype=detail['dtype']))
+        interpreter.invoke()
+        return detail
+
+    batch_size = min(batch_size, len(inputs))
+    input_detail = allocate(batch_size)
+    output_details = interpreter.get_output_details()
+
+    outputs = [[] for _ in output_details]
+    elapsed = 0.0
+    for start in range(0, len(inputs), batch_size):
+        batch = inputs[start:start + batch_size]
+        if len(batch) != input_detail['shape'][0]:
+            # Ultimo batch più corto: si ridimensiona invece di completarlo con zeri (che verrebbero calcolati)
+            input_detail = allocate(len(batch))
+        start_time = time.perf_counter()
+        interpreter.set_tensor(input_detail['index'], from_float(batch, input_detail))
+        interpreter.invoke()
+        batch_outputs = [interpreter.get_tensor(d['index']) for d in output_details]
+        elapsed += time.perf_counter() - start_time
+        for i, output_detail in enumerate(output_details):
+            outputs[i].append(to_float(batch_outputs[i], output_detail))
+    return [np.concatenate(o) for o in outputs], output_details, len(inputs) / elapsed
+
+
+def predict_tflite(model_path, images, batch_size=EVAL_BATCH_SIZE):
+    """Esegue il modello TFLite su tutte le immagini. Restituisce (probabilità, immagini al secondo)."""
+    outputs, _, images_per_second = run_tflite_batches(model_path, images, batch_size)
+    return outputs[0], images_per_second
+
+
+def evaluate_early_exit(stem_path, tail_path, images, labels):
+    """
+    Valuta il modello early exit: per ogni soglia stampa la percentuale di frame che escono in anticipo,
+    l'accuracy risultante e il costo medio per frame (tempo dello stem + tail solo per i frame non usciti).
+    """
+    stem_outputs, stem_details, stem_speed = run_tflite_batches(stem_path, images)
+    outputs_by_tensor = {detail['index']: output for detail, output in zip(stem_details, stem_outputs)}
+    probabilities_detail, features_detail = split_stem_outputs(stem_details)
+    early_probabilities = outputs_by_tensor[probabilities_detail['index']]
+    features = outputs_by_tensor[features_detail['index']]
+    tail_outputs, _, tail_speed = run_tflite_batches(tail_path, features)
+    main_probabilities = tail_outputs[0]
+
+    stem_cost, tail_cost = 1.0 / stem_speed, 1.0 / tail_speed
+    full_cost = stem_cost + tail_cost
+    early_predictions = np.argmax(early_probabilities, axis=1)
+    main_predictions = np.argmax(main_probabilities, axis=1)
+    early_confidence = np.max(early_probabilities, axis=1)
+
+    print("\n=== Early exit ===")
+    print(f"  Accuracy solo testa anticipata: {np.mean(early_predictions == labels) * 100:.2f}%, "
+          f"solo testa principale: {np.mean(main_predictions == labels) * 100:.2f}%")
+    print(f"  Costo per frame: stem {stem_cost * 1000:.3f} ms, tail {tail_cost * 1000:.3f} ms")
+    print(f"  {'Soglia':>6} {'Uscite anticipate':>18} {'Accuracy':>9} {'Costo medio':>12} {'vs completo':>11}")
+    for threshold in EARLY_EXIT_THRESHOLDS:
+        exits = early_confidence >= threshold
+        predictions = np.where(exits, early_predictions, main_predictions)
+        cost = stem_cost + (1 - exits.mean()) * tail_cost
+        print(f"  {threshold:>6.2f} {exits.mean() * 100:>17.1f}% {np.mean(predictions == labels) * 100:>8.2f}% "
+              f"{cost * 1000:>9.3f} ms {cost / full_cost * 100:>10.0f}%")
+
+
+def predict_keras(model, images, batch_size=EVAL_BATCH_SIZE):
+    """Esegue il modello Keras su tutte le immagini. Restituisce (probabilità, immagini al secondo)."""
+    model.predict(images[:batch_size], batch_size=batch_size, verbose=0)  # Riscaldamento (tracing del grafo)
+    start_time = time.perf_counter()
+    probabilities = model.predict(images, batch_size=batch_size, verbose=0)
+    elapsed = time.perf_counter() - start_time
+    return probabilities, len(images) / elapsed
+
+
+def print_report(name, metrics, images_per_second, class_names):
+    """Stampa il riepilogo delle metriche di un modello."""
+    print(f"\n=== {name} ===")
+    print(f"  Accuracy: {metrics['accuracy'] * 100:.2f}%")
+    print(f"  Velocità: {images_per_second:.1f} immagini/s")
+    print("  Matrice di confusione (righe = reale, colonne = predetta):")
+    width = max(len(n) for n in class_names)
+    print("    " + " " * width + " " + " ".join(f"{n:>{width}}" for n in class_names))
+    for class_name, row in zip(class_names, metrics['confusion']):
+        print(f"    {class_name:>{width}} " + " ".join(f"{v:>{width}}" for v in row))
+    for i, class_name in enumerate(class_names):
+        print(f"  {class_name}: precision {metrics['precision'][i] * 100:.2f}%, recall {metrics['recall'][i] * 100:.2f}%")
+
+
+def main():
+    try:
+        val_images, val_labels, class_names = load_validation_data(PREPROCESSED_DATA_FILE)
+    except FileNotFoundError:
+        print(f"ERRORE: File '{PREPROCESSED_DATA_FILE}' non trovato. Esegui prima preprocess_data.py.")
+        return
+    num_classes = len(class_names)
+
+    reference_accuracy = None
+    if os.path.exists(KERAS_MODEL_PATH):
+        model = tf.keras.models.load_model(KERAS_MODEL_PATH)
+        probabilities, speed = predict_keras(model, val_images)
+        metrics = compute_metrics(val_labels, np.argmax(probabilities, axis=1), num_classes)
+        print_report(f"Keras ({KERAS_MODEL_PATH})", metrics, speed, class_names)
+        reference_accuracy = metrics['accuracy']
+    else:
+        print(f"ATTENZIONE: '{KERAS_MODEL_PATH}' non trovato, il confronto con il modello Keras non sarà disponibile.")
+
+    conversion_ok = True
+    for tflite_path in TFLITE_MODEL_PATHS:
+        if not os.path.exists(tflite_path):
+            print(f"ATTENZIONE: '{tflite_path}' non trovato. Salto.")
+            continue
+        probabilities, speed = predict_tflite(tflite_path, val_images)
+        metrics = compute_metrics(val_labels, np.argmax(probabilities, axis=1), num_classes)
+        print_report(f"TFLite ({tflite_path})", metrics, speed, class_names)
+
+        if reference_accuracy is not None:
+            drop = reference_accuracy - metrics['accuracy']
+            print(f"  Differenza rispetto a Keras: {-drop * 100:+.2f} punti percentuali")
+            if drop > MAX_ACCURACY_DROP:
+                print(f"ATTENZIONE: la conversione di '{tflite_path}' ha perso {drop * 100:.2f} punti di accuracy "
+                      f"(soglia {MAX_ACCURACY_DROP * 100:.2f}).")
+                conversion_ok = False
+
+    if os.path.exists(EARLY_EXIT_STEM_TFLITE_PATH) and os.path.exists(EARLY_EXIT_TAIL_TFLITE_PATH):
+        evaluate_early_exit(EARLY_EXIT_STEM_TFLITE_PATH, EARLY_EXIT_TAIL_TFLITE_PATH, val_images, val_labels)
+
+    if reference_accuracy is not None:
+        print("\nEsito conversione: " + ("OK" if conversion_ok else "CALO DI ACCURACY RILEVATO"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+import os
+import numpy as np
+import tensorflow as tf
+
+# --- Parametri ---
+TFLITE_MODEL_PATH = "hand_gesture_model.tflite"  # Modello TFLite prodotto da convert_to_tflite.py
+PREPROCESSED_DATA_FILE = "preprocessed_dataset.npz"  # Usato solo per i nomi delle classi (opzionale)
+
+FIRMWARE_EXPORT_DIR = "firmware_export"  # Cartella in cui scrivere la coppia .h/.cpp per lo sketch Arduino
+C_BASE_NAME = "hand_gesture_model_data"  # Nome dei file generati (hand_gesture_model_data.h / .cpp)
+C_ARRAY_NAME = "g_hand_gesture_model"    # Nome dell'array C che contiene il modello
+
+# TFLite Micro richiede che il buffer del modello e i tensori nell'arena siano allineati a 16 byte
+ARENA_ALIGNMENT = 16
+# Il piano di memoria copre solo i tensori di attivazione. TFLite Micro alloca in più, nella stessa arena,
+# le strutture di runtime (TfLiteEvalTensor, nodi, dati privati degli operatori come i parametri di
+# quantizzazione per canale). Stimiamo questa parte con un costo fisso per tensore e per operatore.
+ARENA_OVERHEAD_PER_TENSOR = 64   # Byte
+ARENA_OVERHEAD_PER_OP = 256      # Byte
+ARENA_SAFETY_MARGIN = 0.20       # Margine di sicurezza (20%) sul totale stimato
+ESP32_ARENA_BUDGET_KB = 200      # RAM che siamo disposti a dedicare all'arena sull'ESP32 (solo per l'avviso)
+# --- Fine Parametri ---
+
+# Corrispondenza tra i nomi degli operatori TFLite e i metodi di tflite::MicroMutableOpResolver
+OP_RESOLVER_METHODS = {
+    "ADD": "AddAdd",
+    "AVERAGE_POOL_2D": "AddAveragePool2D",
+    "CONCATENATION": "AddConcatenation",
+    "CONV_2D": "AddConv2D",
+    "DEPTHWISE_CONV_2D": "AddDepthwiseConv2D",
+    "DEQUANTIZE": "AddDequantize",
+    "FULLY_CONNECTED": "AddFullyConnected",
+    "LOGISTIC": "AddLogistic",
+    "MAX_POOL_2D": "AddMaxPool2D",
+    "MEAN": "AddMean",
+    "MUL": "AddMul",
+    "PACK": "AddPack",      # Flatten di Keras 3 con batch dinamico: SHAPE/STRIDED_SLICE/PACK prima del RESHAPE
+    "PAD": "AddPad",
+    "QUANTIZE": "AddQuantize",
+    "RELU": "AddRelu",
+    "RELU6": "AddRelu6",
+    "RESHAPE": "AddReshape",
+    "SHAPE": "AddShape",
+    "SOFTMAX": "AddSoftmax",
+    "STRIDED_SLICE": "AddStridedSlice",
+}
+
+
+def align_up(value, alignment):
+    """Arrotonda 'value' al multiplo di 'alignment' successivo."""
+    return (value + alignment - 1) // alignment * alignment
+
+
+def load_class_names(npz_path):
+    """Legge i nomi delle classi dal file .npz, se disponibile."""
+    try:
+        with np.load(npz_path) as data:
+            return [str(name) for name in data['class_names']]
+    except (FileNotFoundError, KeyError):
+        print(f"ATTENZIONE: nomi delle classi non disponibili da '{npz_path}'. Non verranno esportati.")
+        return None
+
+
+def tensor_size_bytes(tensor_detail):
+    """Dimensione in byte di un tensore a partire dai dettagli restituiti dall'interprete."""
+    num_elements = int(np.prod(tensor_detail['shape'])) if len(tensor_detail['shape']) > 0 else 1
+    return num_elements * np.dtype(tensor_detail['dtype']).itemsize
+
+
+def get_ops_details(interpreter):
+    """
+    Elenco degli operatori del grafo. TFLite lo espone solo con il metodo privato _get_ops_details()
+    (verificato con TensorFlow 2.21): se una versione futura lo rimuove
+    si solleva un errore esplicito invece di un AttributeError generico.
+    """
+    if not hasattr(interpreter, '_get_ops_details'):
+        raise RuntimeError("questa versione di TensorFlow Lite non espone _get_ops_details(): "
+                           "impossibile ricostruire il grafo degli operatori per il firmware.")
+    return interpreter._get_ops_details()
+
+
+def plan_tensor_arena(interpreter):
+    """
+    Ricostruisce il piano di memoria dei tensori di attivazione usando il grafo dell'interprete
+    (stesso algoritmo "greedy by size" del GreedyMemoryPlanner di TFLite Micro).
+    Restituisce (byte dell'arena per le attivazioni, numero di tensori, lista degli operatori).
+    """
+    ops = get_ops_details(interpreter)
+    tensors = {t['index']: t for t in interpreter.get_tensor_details()}
+    graph_inputs = [d['index'] for d in interpreter.get_input_details()]
+    graph_outputs = [d['index'] for d in interpreter.get_output_details()]
+
+    # Un tensore è un'attivazione se è un input del grafo o se è prodotto da un operatore.
+    # Tutti gli altri (pesi, bias) sono costanti e restano nella flash insieme al modello.
+    first_use = {index: 0 for index in graph_inputs}
+    last_use = {index: 0 for index in graph_inputs}
+    for op_index, op in enumerate(ops):
+        for tensor_index in op['outputs']:
+            if tensor_index >= 0:
+                first_use.setdefault(tensor_index, op_index)
+                last_use[tensor_index] = max(last_use.get(tensor_index, op_index), op_index)
+        for tensor_index in op['inputs']:
+            if tensor_index in first_use:
+                last_use[tensor_index] = max(last_use[tensor_index], op_index)
+    for index in graph_outputs:
+        last_use[index] = len(ops)
+
+    buffers = [(align_up(tensor_size_bytes(tensors[i]), ARENA_ALIGNMENT), first_use[i], last_use[i])
+               for i in first_use]
+    buffers.sort(key=lambda b: b[0], reverse=True)
+
+    placed = []  # (offset, size, first_use, last_use)
+    arena_size = 0
+    for size, first, last in buffers:
+        # Solo i buffer vivi nello stesso intervallo di operatori possono entrare in conflitto
+        overlapping = sorted((p for p in placed if not (p[3] < first or last < p[2])), key=lambda p: p[0])
+        offset = 0
+        for p_offset, p_size, _, _ in overlapping:
+            if offset + size <= p_offset:
+                break
+            offset = max(offset, p_offset + p_size)
+        placed.append((offset, size, first, last))
+        arena_size = max(arena_size, offset + size)
+
+    return arena_size, len(tensors), ops
+
+
+def estimate_tensor_arena_size(interpreter):
+    """Stima la dimensione minima della tensor arena (piano di memoria + overhead + margine)."""
+    activations_bytes, num_tensors, ops = plan_tensor_arena(interpreter)
+    overhead = num_tensors * ARENA_OVERHEAD_PER_TENSOR + len(ops) * ARENA_OVERHEAD_PER_OP
+    total = int((activations_bytes + overhead) * (1 + ARENA_SAFETY_MARGIN))
+    arena_size = align_up(total, 1024)
+
+    print(f"  Memoria attivazioni (piano greedy): {activations_bytes / 1024:.2f} KB")
+    print(f"  Overhead runtime stimato: {overhead / 1024:.2f} KB ({num_tensors} tensori, {len(ops)} operatori)")
+    print(f"  Tensor arena consigliata (+{ARENA_SAFETY_MARGIN * 100:.0f}% margine): {arena_size / 1024:.0f} KB")
+    if arena_size > ESP32_ARENA_BUDGET_KB * 1024:
+        print(f"ATTENZIONE: l'arena supera il budget di {ESP32_ARENA_BUDGET_KB} KB previsto per l'ESP32. "
+              f"Valuta la quantizzazione INT8 in convert_to_tflite.py.")
+    return arena_size, ops
+
+
+def required_op_resolver_methods(ops):
+    """Restituisce i metodi AddXxx() del MicroMutableOpResolver necessari, nell'ordine di primo utilizzo."""
+    methods = []
+    for op in ops:
+        op_name = op['op_name']
+        method = OP_RESOLVER_METHODS.get(op_name)
+        if method is None:
+            print(f"ATTENZIONE: operatore '{op_name}' non presente in OP_RESOLVER_METHODS, aggiungilo a mano.")
+            method = "Add" + "".join(part.capitalize() for part in op_name.split("_"))
+        if method not in methods:
+            methods.append(method)
+    return methods
+
+
+def quantization_params(tensor_detail):
+    """Restituisce (scale, zero_point) del tensore; scale = 0 indica un tensore float non quantizzato."""
+    scale, zero_point = tensor_detail['quantization']
+    return float(scale), int(zero_point)
+
+
+def format_c_array(data, bytes_per_line=12):
+    """Formatta i byte del modello come corpo di un array C."""
+    lines = []
+    for start in range(0, len(data), bytes_per_line):
+        chunk = data[start:start + bytes_per_line]
+        lines.append("  " + ", ".join(f"0x{b:02x}" for b in chunk) + ",")
+    return "\n".join(lines)
+
+
+def write_c_files(tflite_model, input_detail, output_detail, arena_size, op_methods, class_names):
+    """Scrive la coppia .h/.cpp con il modello, i parametri di quantizzazione e la configurazione per TFLite Micro."""
+    os.makedirs(FIRMWARE_EXPORT_DIR, exist_ok=True)
+    header_path = os.path.join(FIRMWARE_EXPORT_DIR, f"{C_BASE_NAME}.h")
+    source_path = os.path.join(FIRMWARE_EXPORT_DIR, f"{C_BASE_NAME}.cpp")
+    guard = f"{C_BASE_NAME.upper()}_H"
+
+    input_scale, input_zero_point = quantization_params(input_detail)
+    output_scale, output_zero_point = quantization_params(output_detail)
+    _, input_height, input_width, input_channels = [int(d) for d in input_detail['shape']]
+    num_classes = int(output_detail['shape'][-1])
+
+    header = [
+        f"// Generato automaticamente da export_firmware.py a partire da {os.path.basename(TFLITE_MODEL_PATH)}.",
+        "// NON modificare a mano: rigenera il file dopo ogni nuova conversione del modello.",
+        f"#ifndef {guard}",
+        f"#define {guard}",
+        "",
+        "#include <stddef.h>",
+        "#include <stdint.h>",
+        "",
+        f"extern const unsigned char {C_ARRAY_NAME}[];",
+        f"extern const unsigned int {C_ARRAY_NAME}_len;",
+        "",
+        "// Forma dell'input e numero di classi",
+        f"constexpr int kInputHeight = {input_height};",
+        f"constexpr int kInputWidth = {input_width};",
+        f"constexpr int kInputChannels = {input_channels};",
+        f"constexpr int kNumClasses = {num_classes};",
+        "",
+        "// Parametri di quantizzazione (scale = 0 -> tensore float32 non quantizzato)",
+        "// valore_reale = scale * (valore_quantizzato - zero_point)",
+        f"constexpr bool kInputIsQuantized = {'true' if input_scale != 0 else 'false'};",
+        f"constexpr float kInputScale = {input_scale!r}f;",
+        f"constexpr int32_t kInputZeroPoint = {input_zero_point};",
+        f"constexpr bool kOutputIsQuantized = {'true' if output_scale != 0 else 'false'};",
+        f"constexpr float kOutputScale = {output_scale!r}f;",
+        f"constexpr int32_t kOutputZeroPoint = {output_zero_point};",
+        "",
+        "// Dimensione minima della tensor arena (piano di memoria dell'interprete + overhead + margine)",
+        f"constexpr size_t kTensorArenaSize = {arena_size};",
+        "",
+        "// Operatori richiesti dal modello. Uso:",
+        "//   static tflite::MicroMutableOpResolver<kOpResolverSize> resolver;",
+        f"//   {C_BASE_NAME.upper()}_ADD_OPS(resolver);",
+        f"constexpr int kOpResolverSize = {len(op_methods)};",
+        f"#define {C_BASE_NAME.upper()}_ADD_OPS(resolver) \\",
+        "  do { \\",
+    ]
+    header += [f"    (resolver).{method}(); \\" for method in op_methods]
+    header += ["  } while (0)", ""]
+    if class_names:
+        names = ", ".join(f'"{name}"' for name in class_names)
+        header += ["// Nomi delle classi nello stesso ordine dell'output del modello",
+                   f"static const char* const kClassNames[kNumClasses] = {{{names}}};", ""]
+    header += [f"#endif  // {guard}", ""]
+
+    source = [
+        f'#include "{C_BASE_NAME}.h"',
+        "",
+        "// Il modello resta in flash (const) ed è allineato a 16 byte come richiesto da TFLite Micro",
+        f"alignas(16) const unsigned char {C_ARRAY_NAME}[] = {{",
+        format_c_array(tflite_model),
+        "};",
+        f"const unsigned int {C_ARRAY_NAME}_len = {len(tflite_model)};",
+        "",
+    ]
+
+    with open(header_path, 'w') as f:
+        f.write("\n".join(header))
+    with open(source_path, 'w') as f:
+        f.write("\n".join(source))
+    print(f"File per il firmware salvati in: {header_path}, {source_path}")
+
+
+def export_firmware_files(tflite_model):
+    """Genera i file C per il firmware a partire dal modello TFLite (bytes)."""
+    print("\nEsportazione del modello per il firmware ESP32...")
+    # Senza delegati di default: XNNPACK fonderebbe gli operatori in un unico nodo DELEGATE,
+    # mentre a noi serve il grafo così come lo eseguirà TFLite Micro
+    interpreter = tf.lite.Interpreter(
+        model_content=tflite_model,
+        experimental_op_resolver_type=tf.lite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES)
+    interpreter.allocate_tensors()
+    input_detail = interpreter.get_input_details()[0]
+    output_detail = interpreter.get_output_details()[0]
+
+    try:
+        arena_size, ops = estimate_tensor_arena_size(interpreter)
+    except RuntimeError as e:
+        print(f"ERRORE durante l'esportazione per il firmware: {e}")
+        return
+    op_methods = required_op_resolver_methods(ops)
+    print(f"  Operatori richiesti: {', '.join(op_methods)}")
+
+    class_names = load_class_names(PREPROCESSED_DATA_FILE)
+    write_c_files(tflite_model, input_detail, output_detail, arena_size, op_methods, class_names)
+
+
+def main():
+    print(f"Caricamento del modello TFLite da: {TFLITE_MODEL_PATH}")
+    try:
+        with open(TFLITE_MODEL_PATH, 'rb') as f:
+            tflite_model = f.read()
+    except FileNotFoundError:
+        print(f"ERRORE: File '{TFLITE_MODEL_PATH}' non trovato. Esegui prima convert_to_tflite.py.")
+        return
+    export_firmware_files(tflite_model)
+
+
+if __name__ == '__main__':
+    main()
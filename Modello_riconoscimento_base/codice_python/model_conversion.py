@@ -0,0 +1,56 @@
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+# Funzioni di conversione condivise da train_model.py e convert_to_tflite.py
+# (in un modulo separato per evitare che i due script si importino a vicenda)
+
+# --- Parametri ---
+# Layer della parte "costosa" del modello early exit (dopo il punto di uscita anticipata), nell'ordine in cui
+# vengono applicati: devono corrispondere ai nomi usati in build_early_exit_model() di train_model.py
+EARLY_EXIT_TAIL_LAYERS = ["block2_conv", "block2_pool", "flatten", "dense", "main_exit"]
+NUM_CALIBRATION_IMAGES = 100 # Numero di immagini da usare per la calibrazione INT8
+# --- Fine Parametri ---
+
+
+def split_early_exit_model(model):
+    """
+    Divide il modello early exit in due modelli invocabili separatamente (condividono i pesi):
+    - stem: immagine -> (probabilità della testa anticipata, feature del primo blocco)
+    - tail: feature del primo blocco -> probabilità della testa principale
+    """
+    stem = keras.Model(model.input, [model.get_layer("early_exit").output, model.get_layer("block1_pool").output],
+                       name="early_exit_stem")
+    tail_input = keras.Input(shape=model.get_layer("block1_pool").output.shape[1:], name="features")
+    x = tail_input
+    for layer_name in EARLY_EXIT_TAIL_LAYERS:
+        x = model.get_layer(layer_name)(x)
+    tail = keras.Model(tail_input, x, name="early_exit_tail")
+    return stem, tail
+
+
+def convert_to_int8(model, calibration_images):
+    """
+    Quantizzazione post-addestramento INT8 completa (pesi, attivazioni, input e output int8),
+    calibrata sulle immagini passate. Usata da convert_to_tflite.py e, per il confronto con il QAT, da train_model.py.
+    """
+    def representative_dataset_gen():
+        for value in calibration_images:
+            yield [np.array(value[np.newaxis], dtype=np.float32)] # Un'immagine alla volta, con la dimensione del batch
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset_gen
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+def convert_qat_model(qat_model):
+    """Converte il modello QAT in TFLite int8: i range dei fake-quant diventano i parametri di quantizzazione."""
+    converter = tf.lite.TFLiteConverter.from_keras_model(qat_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    return converter.convert()
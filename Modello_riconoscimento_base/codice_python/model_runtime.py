@@ -0,0 +1,169 @@
+import json
+import os
+import sys
+import time
+import numpy as np
+
+# Istante di import del modulo: importandolo per primo, misura l'avvio a freddo dello script
+PROCESS_START_TIME = time.perf_counter()
+
+# --- Runtime leggero per l'inferenza ---
+# Sui piccoli host di edge basta il runtime TFLite standalone (pip install tflite-runtime oppure ai-edge-litert):
+# si importa in pochi millisecondi e occupa una frazione della memoria di TensorFlow completo.
+# TensorFlow viene importato solo se nessuno dei due è installato.
+# I metadati del modello (classi e dimensioni dell'input) stanno in un piccolo file JSON accanto al .tflite
+# (es. hand_gesture_model.json), scritto da convert_to_tflite.py, così non serve aprire preprocessed_dataset.npz.
+METADATA_EXTENSION = ".json"
+# --- Fine Runtime leggero ---
+
+
+def load_interpreter_class():
+    """Restituisce (classe Interpreter, nome del backend) scegliendo il runtime più leggero disponibile."""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter, "tflite_runtime"
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter, "ai_edge_litert"
+    except ImportError:
+        pass
+    import tensorflow as tf  # Import pesante: solo come ultima risorsa
+    return tf.lite.Interpreter, "tensorflow"
+
+
+def metadata_path_for(model_path):
+    """Percorso del file di metadati associato al modello (stesso nome, estensione .json)."""
+    return os.path.splitext(model_path)[0] + METADATA_EXTENSION
+
+
+def write_model_metadata(model_path, class_names, img_height, img_width):
+    """Scrive il file di metadati accanto al modello TFLite."""
+    metadata = {
+        'class_names': [str(name) for name in class_names],
+        'img_height': int(img_height),
+        'img_width': int(img_width),
+    }
+    path = metadata_path_for(model_path)
+    with open(path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    print(f"Metadati del modello salvati in: {path}")
+
+
+def load_model_metadata(model_path, npz_fallback_path=None):
+    """
+    Legge (nomi delle classi, altezza, larghezza) dal file di metadati del modello.
+    Se manca, ripiega sul file .npz leggendo solo le chiavi necessarie.
+    Solleva FileNotFoundError o KeyError se nessuna delle due fonti è disponibile.
+    """
+    path = metadata_path_for(model_path)
+    if os.path.exists(path):
+        with open(path) as f:
+            metadata = json.load(f)
+        return metadata['class_names'], int(metadata['img_height']), int(metadata['img_width'])
+
+    if npz_fallback_path is None:
+        raise FileNotFoundError(path)
+    print(f"ATTENZIONE: '{path}' non trovato, lettura dei metadati da '{npz_fallback_path}' (più lento).")
+    with np.load(npz_fallback_path) as data:
+        class_names = [str(name) for name in data['class_names']]
+        img_width = int(data['img_width'][0])
+        img_height = int(data['img_height'][0])
+    return class_names, img_height, img_width
+
+
+def peak_memory_mb():
+    """Memoria residente di picco del processo in MB (None se non disponibile, es. su Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux restituisce KB, macOS byte
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def report_startup(backend):
+    """Stampa il tempo di avvio a freddo (dall'import di questo modulo) e la memoria di picco."""
+    elapsed = time.perf_counter() - PROCESS_START_TIME
+    peak = peak_memory_mb()
+    peak_text = f"{peak:.1f} MB" if peak is not None else "n/d"
+    print(f"Avvio a freddo ({backend}): {elapsed:.2f} s, memoria di picco: {peak_text}")
+
+
+def to_float(values, detail):
+    """Dequantizza un tensore di output (se il modello è int8/uint8)."""
+    if detail['dtype'] == np.float32:
+        return values
+    scale, zero_point = detail['quantization']
+    return (values.astype(np.float32) - zero_point) * scale
+
+
+def from_float(values, detail):
+    """Porta valori float (es. immagini 0-1) nel tipo di input del modello: float32, int8 o uint8."""
+    if detail['dtype'] == np.float32:
+        return values.astype(np.float32)
+    scale, zero_point = detail['quantization']
+    info = np.iinfo(detail['dtype'])
+    return np.clip(np.round(values / scale + zero_point), info.min, info.max).astype(detail['dtype'])
+
+
+def split_stem_outputs(output_details):
+    """Il convertitore non garantisce l'ordine delle uscite dello stem: le feature sono il tensore a 4 dimensioni."""
+    features = next(d for d in output_details if len(d['shape']) == 4)
+    probabilities = next(d for d in output_details if len(d['shape']) != 4)
+    return probabilities, features
+
+
+class EarlyExitRunner:
+    """
+    Esegue il modello early exit esportato da convert_to_tflite.py: prima lo stem (primo blocco + testa
+    anticipata); se la confidenza anticipata raggiunge 'threshold' si ferma, altrimenti passa le feature al tail.
+    """
+
+    def __init__(self, interpreter_class, stem_path, tail_path, threshold):
+        self.stem = interpreter_class(model_path=stem_path)
+        self.tail = interpreter_class(model_path=tail_path)
+        self.stem.allocate_tensors()
+        self.tail.allocate_tensors()
+        self.stem_input = self.stem.get_input_details()[0]
+        self.stem_probabilities, self.stem_features = split_stem_outputs(self.stem.get_output_details())
+        self.tail_input = self.tail.get_input_details()[0]
+        self.tail_output = self.tail.get_output_details()[0]
+        self.threshold = threshold
+
+        self.frames = 0
+        self.early_exits = 0
+        self.total_time = 0.0
+
+    def warm_up(self):
+        """Inferenza a vuoto di stem e tail (esclusa dalle statistiche): completa l'inizializzazione."""
+        for interpreter, detail in [(self.stem, self.stem_input), (self.tail, self.tail_input)]:
+            interpreter.set_tensor(detail['index'], np.zeros(detail['shape'], dtype=detail['dtype']))
+            interpreter.invoke()
+
+    def predict(self, input_data):
+        """Restituisce (probabilità, True se il frame è uscito dalla testa anticipata)."""
+        start_time = time.perf_counter()
+        self.stem.set_tensor(self.stem_input['index'], from_float(input_data, self.stem_input))
+        self.stem.invoke()
+        probabilities = to_float(self.stem.get_tensor(self.stem_probabilities['index']), self.stem_probabilities)
+        exited_early = float(np.max(probabilities)) >= self.threshold
+        if not exited_early:
+            features = to_float(self.stem.get_tensor(self.stem_features['index']), self.stem_features)
+            self.tail.set_tensor(self.tail_input['index'], from_float(features, self.tail_input))
+            self.tail.invoke()
+            probabilities = to_float(self.tail.get_tensor(self.tail_output['index']), self.tail_output)
+
+        self.frames += 1
+        self.early_exits += int(exited_early)
+        self.total_time += time.perf_counter() - start_time
+        return probabilities, exited_early
+
+    def report(self):
+        """Stampa la percentuale di uscite anticipate e il tempo medio di inferenza per frame."""
+        if self.frames == 0:
+            return
+        print(f"Early exit: {self.early_exits / self.frames * 100:.1f}% dei frame usciti in anticipo "
+              f"(soglia {self.threshold:.2f}), inferenza media {self.total_time / self.frames * 1000:.2f} ms/frame")
@@ -1,8 +1,9 @@
 import cv2
 import os
 import numpy as np
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, StratifiedGroupKFold
 import matplotlib.pyplot as plt # Opzionale, per visualizzare qualche immagine
+from dedup_dataset import near_duplicate_groups_per_class
 
 # --- Parametri di Pre-elaborazione ---
 DATASET_PATH = "dataset"  # Cartella principale contenente le sottocartelle delle classi
@@ -14,8 +15,46 @@ IMG_HEIGHT = 96          # Altezza desiderata per le immagini ridimensionate
 # Nomi delle classi (devono corrispondere esattamente ai nomi delle tue cartelle nel dataset)
 # Aggiungi o modifica in base alle classi che hai raccolto
 CLASS_NAMES = ["mano_alzata", "mano_abbassata"]
+
+# Tiene i gruppi di quasi-duplicati (vedi dedup_dataset.py) interamente in training o interamente in validazione,
+# altrimenti frame quasi identici finiscono in entrambi gli split e la validation accuracy risulta gonfiata.
+# I gruppi sono catene di frame simili e possono essere grandi: la divisione per classe può quindi scostarsi
+# dall'80/20. Tra i VALIDATION_FOLDS fold si sceglie quello più bilanciato e lo scostamento viene stampato.
+GROUP_NEAR_DUPLICATES = True
+VALIDATION_FOLDS = 5            # 5 fold = ~20% in validazione
+MAX_VALIDATION_SHARE_DEVIATION = 0.10  # Oltre questo scostamento per classe (10 punti) viene stampato un avviso
 # --- Fine Parametri ---
 
+def validation_share_per_class(labels, val_idx, num_classes):
+    """Frazione delle immagini di ogni classe che finisce in validazione."""
+    totals = np.bincount(labels, minlength=num_classes)
+    in_val = np.bincount(labels[val_idx], minlength=num_classes)
+    return in_val / np.maximum(totals, 1)
+
+def select_balanced_group_fold(labels, groups, class_names):
+    """
+    Divide con StratifiedGroupKFold e usa come validazione il fold in cui la quota di ogni classe è più
+    vicina a 1 / VALIDATION_FOLDS. Stampa la divisione per classe e avvisa se resta sbilanciata.
+    """
+    target = 1 / VALIDATION_FOLDS
+    splitter = StratifiedGroupKFold(n_splits=VALIDATION_FOLDS, shuffle=True, random_state=42)
+    folds = list(splitter.split(np.zeros(len(labels)), labels, groups))
+    deviations = [np.abs(validation_share_per_class(labels, val_idx, len(class_names)) - target).max()
+                  for _, val_idx in folds]
+    best = int(np.argmin(deviations))
+    train_idx, val_idx = folds[best]
+
+    shares = validation_share_per_class(labels, val_idx, len(class_names))
+    print(f"Fold di validazione scelto: {best + 1}/{VALIDATION_FOLDS} (obiettivo {target * 100:.0f}% per classe)")
+    for class_index, class_name in enumerate(class_names):
+        total = int(np.sum(labels == class_index))
+        in_val = int(np.sum(labels[val_idx] == class_index))
+        print(f"  {class_name}: {total - in_val} training / {in_val} validazione ({shares[class_index] * 100:.0f}%)")
+    if deviations[best] > MAX_VALIDATION_SHARE_DEVIATION:
+        print(f"ATTENZIONE: divisione sbilanciata di {deviations[best] * 100:.0f} punti: i gruppi di quasi-duplicati "
+              f"sono troppo grandi. Compatta il dataset con dedup_dataset.py o raccogli frame più vari.")
+    return train_idx, val_idx
+
 def load_and_preprocess_images(dataset_path, class_names, img_width, img_height):
     """
     Carica le immagini dal dataset, le ridimensiona, le converte in scala di grigi,
@@ -97,10 +136,21 @@ def main():
     # test_size=0.2 significa che il 20% dei dati andrà al validation set, l'80% al training.
     # random_state assicura che la divisione sia la stessa ogni volta che esegui lo script.
     # stratify=labels è utile per assicurarsi che la proporzione delle classi sia simile in entrambi i set.
+    # Con GROUP_NEAR_DUPLICATES si usa StratifiedGroupKFold (un fold è la validazione):
+    # stratificato come prima, ma ogni gruppo di quasi-duplicati resta in un solo split.
     try:
-        train_images, val_images, train_labels, val_labels = train_test_split(
-            images, labels, test_size=0.2, random_state=42, stratify=labels
-        )
+        if GROUP_NEAR_DUPLICATES:
+            groups = near_duplicate_groups_per_class(images, labels)
+            group_sizes = np.bincount(groups)
+            print(f"\nGruppi di quasi-duplicati: {len(group_sizes)} gruppi per {len(labels)} immagini "
+                  f"(il più grande ha {group_sizes.max()} immagini).")
+            train_idx, val_idx = select_balanced_group_fold(labels, groups, CLASS_NAMES)
+            train_images, val_images = images[train_idx], images[val_idx]
+            train_labels, val_labels = labels[train_idx], labels[val_idx]
+        else:
+            train_images, val_images, train_labels, val_labels = train_test_split(
+                images, labels, test_size=0.2, random_state=42, stratify=labels
+            )
         print("\nDataset diviso con successo:")
         print(f"Immagini di addestramento: {train_images.shape}, Etichette di addestramento: {train_labels.shape}")
         print(f"Immagini di validazione: {val_images.shape}, Etichette di validazione: {val_labels.shape}")
@@ -1,34 +1,26 @@
+import model_runtime # Importato per primo: misura l'avvio a freddo dello script
 import cv2
 import numpy as np
-import tensorflow as tf
 import time
 import signal
 import sys
-import os
 
 # --- Parametri ---
 TFLITE_MODEL_PATH = "hand_gesture_model.tflite"
 RTSP_URL = "rtsp://localhost:8554/webcam_stream" # Il tuo URL RTSP
 
-# Carica i nomi delle classi e le dimensioni dell'immagine dal file .npz
-# per assicurare consistenza con l'addestramento.
+# Nomi delle classi e dimensioni dell'immagine vengono letti dal file di metadati accanto al modello
+# (hand_gesture_model.json, scritto da convert_to_tflite.py) per assicurare consistenza con l'addestramento.
+# Se manca, si ripiega sul file .npz.
 PREPROCESSED_DATA_FILE = "preprocessed_dataset.npz"
 
-try:
-    with np.load(PREPROCESSED_DATA_FILE) as data:
-        CLASS_NAMES = data['class_names']
-        IMG_WIDTH = int(data['img_width'][0])
-        IMG_HEIGHT = int(data['img_height'][0])
-    print(f"Caricati nomi classi: {CLASS_NAMES}, IMG_HEIGHT: {IMG_HEIGHT}, IMG_WIDTH: {IMG_WIDTH}")
-except FileNotFoundError:
-    print(f"ERRORE: File '{PREPROCESSED_DATA_FILE}' non trovato.")
-    print("Questo file è necessario per ottenere i nomi delle classi e le dimensioni delle immagini usate per l'addestramento.")
-    print("Assicurati di aver eseguito prima lo script 'preprocess_data.py'.")
-    sys.exit(1)
-except KeyError as e:
-    print(f"ERRORE: Chiave mancante ({e}) nel file '{PREPROCESSED_DATA_FILE}'.")
-    print("Assicurati che il file .npz contenga 'class_names', 'img_width' e 'img_height'.")
-    sys.exit(1)
+# Modello early exit (vedi EARLY_EXIT in train_model.py): se True si usano i due file al posto di TFLITE_MODEL_PATH
+# (è una rete addestrata a parte) e i frame con confidenza anticipata >= EARLY_EXIT_THRESHOLD saltano i layer
+# più costosi. Il modello completo in quel caso non viene caricato.
+USE_EARLY_EXIT = False
+EARLY_EXIT_STEM_TFLITE_PATH = "hand_gesture_model_exit1.tflite"
+EARLY_EXIT_TAIL_TFLITE_PATH = "hand_gesture_model_exit2.tflite"
+EARLY_EXIT_THRESHOLD = 0.90
 
 # Dimensioni per la visualizzazione
 DISPLAY_WIDTH = 640
@@ -53,18 +45,34 @@ def preprocess_frame(frame, target_height, target_width):
     return np.expand_dims(img_normalized, axis=0)
 
 
-def main():
-    global stop_program
-    # Carica il modello TFLite e alloca i tensori.
-    print(f"Caricamento del modello TFLite da: {TFLITE_MODEL_PATH}")
+def load_metadata():
+    """Legge nomi delle classi e dimensioni delle immagini (metadati del modello o, in mancanza, file .npz)."""
     try:
-        interpreter = tf.lite.Interpreter(model_path=TFLITE_MODEL_PATH)
+        class_names, img_height, img_width = model_runtime.load_model_metadata(TFLITE_MODEL_PATH, PREPROCESSED_DATA_FILE)
+    except FileNotFoundError:
+        print(f"ERRORE: Né '{model_runtime.metadata_path_for(TFLITE_MODEL_PATH)}' né '{PREPROCESSED_DATA_FILE}' sono stati trovati.")
+        print("Questi file sono necessari per ottenere i nomi delle classi e le dimensioni delle immagini usate per l'addestramento.")
+        print("Assicurati di aver eseguito prima gli script 'preprocess_data.py' e 'convert_to_tflite.py'.")
+        sys.exit(1)
+    except KeyError as e:
+        print(f"ERRORE: Chiave mancante ({e}) nei metadati del modello.")
+        print("Assicurati che contengano 'class_names', 'img_width' e 'img_height'.")
+        sys.exit(1)
+    print(f"Caricati nomi classi: {class_names}, IMG_HEIGHT: {img_height}, IMG_WIDTH: {img_width}")
+    return class_names, img_height, img_width
+
+
+def load_full_model(Interpreter, backend, img_height, img_width):
+    """Carica il modello completo, controlla la forma dell'input e lo riscalda. Restituisce None in caso di errore."""
+    print(f"Caricamento del modello TFLite da: {TFLITE_MODEL_PATH} (runtime: {backend})")
+    try:
+        interpreter = Interpreter(model_path=TFLITE_MODEL_PATH)
         interpreter.allocate_tensors() # Fondamentale!
         print("Modello TFLite caricato e tensori allocati.")
     except Exception as e:
         print(f"ERRORE durante il caricamento del modello TFLite: {e}")
         print("Assicurati che il file '.tflite' esista e sia valido.")
-        return
+        return None
 
     # Ottieni i dettagli dei tensori di input e output
     input_details = interpreter.get_input_details()
@@ -74,15 +82,51 @@ def main():
     print(f"  Output tensor details: {output_details}")
 
     # Verifica che le dimensioni di input del modello TFLite corrispondano
-    # a IMG_HEIGHT, IMG_WIDTH (dopo aver aggiunto batch e canali)
-    # input_shape atteso è (1, IMG_HEIGHT, IMG_WIDTH, 1)
-    expected_input_shape = (1, IMG_HEIGHT, IMG_WIDTH, 1)
+    # a img_height, img_width (dopo aver aggiunto batch e canali)
+    # input_shape atteso è (1, img_height, img_width, 1)
+    expected_input_shape = (1, img_height, img_width, 1)
     if tuple(input_details[0]['shape']) != expected_input_shape:
         print(f"ATTENZIONE: La forma dell'input del modello TFLite {input_details[0]['shape']} "
               f"non corrisponde alla forma attesa {expected_input_shape} "
-              f"basata su IMG_HEIGHT/IMG_WIDTH dal file .npz.")
+              f"basata sulle dimensioni lette dai metadati del modello.")
         # Potresti voler terminare o gestire questo caso, ma per ora continuiamo.
 
+    # Prima inferenza a vuoto: completa l'inizializzazione, così il tempo di avvio misurato è realistico
+    interpreter.set_tensor(input_details[0]['index'], np.zeros(input_details[0]['shape'], dtype=input_details[0]['dtype']))
+    interpreter.invoke()
+
+    return interpreter
+
+
+def main():
+    global stop_program
+    CLASS_NAMES, IMG_HEIGHT, IMG_WIDTH = load_metadata()
+
+    # Carica il modello TFLite e alloca i tensori.
+    # Si usa il runtime TFLite standalone se installato; TensorFlow solo come ripiego.
+    Interpreter, backend = model_runtime.load_interpreter_class()
+    early_exit_runner = None
+    if USE_EARLY_EXIT:
+        # Si caricano solo i due modelli stem/tail, non il modello completo
+        print(f"Caricamento del modello early exit da: {EARLY_EXIT_STEM_TFLITE_PATH} + {EARLY_EXIT_TAIL_TFLITE_PATH} "
+              f"(runtime: {backend}, soglia {EARLY_EXIT_THRESHOLD:.2f})")
+        try:
+            early_exit_runner = model_runtime.EarlyExitRunner(Interpreter, EARLY_EXIT_STEM_TFLITE_PATH,
+                                                              EARLY_EXIT_TAIL_TFLITE_PATH, EARLY_EXIT_THRESHOLD)
+        except Exception as e:
+            print(f"ERRORE durante il caricamento del modello early exit: {e}")
+            print("Esegui train_model.py con EARLY_EXIT = True e convert_to_tflite.py, oppure imposta USE_EARLY_EXIT = False.")
+            return
+        # Prima inferenza a vuoto: completa l'inizializzazione, così il tempo di avvio misurato è realistico
+        early_exit_runner.warm_up()
+    else:
+        interpreter = load_full_model(Interpreter, backend, IMG_HEIGHT, IMG_WIDTH)
+        if interpreter is None:
+            return
+        input_details = interpreter.get_input_details()
+        output_details = interpreter.get_output_details()
+    model_runtime.report_startup(backend)
+
     print(f"\nTentativo di connessione allo stream RTSP: {RTSP_URL}")
     cap = cv2.VideoCapture(RTSP_URL)
 
@@ -105,14 +149,20 @@ def main():
         # 1. Pre-elabora il frame catturato
         input_data = preprocess_frame(frame_bgr, IMG_HEIGHT, IMG_WIDTH)
 
-        # 2. Imposta il tensore di input
-        interpreter.set_tensor(input_details[0]['index'], input_data)
+        exit_label = ""
+        if early_exit_runner is not None:
+            # 2-4. Stem + eventuale tail: si ferma alla testa anticipata se è abbastanza sicura
+            output_data, exited_early = early_exit_runner.predict(input_data)
+            exit_label = " [uscita 1]" if exited_early else " [uscita 2]"
+        else:
+            # 2. Imposta il tensore di input (quantizzato se il modello è int8)
+            interpreter.set_tensor(input_details[0]['index'], model_runtime.from_float(input_data, input_details[0]))
 
-        # 3. Esegui l'inferenza
-        interpreter.invoke()
+            # 3. Esegui l'inferenza
+            interpreter.invoke()
 
-        # 4. Ottieni i risultati dell'output
-        output_data = interpreter.get_tensor(output_details[0]['index'])
+            # 4. Ottieni i risultati dell'output
+            output_data = model_runtime.to_float(interpreter.get_tensor(output_details[0]['index']), output_details[0])
         # output_data è un array di probabilità, es. [[0.1, 0.8, 0.1]] per 3 classi
 
         predicted_class_index = np.argmax(output_data[0])
@@ -128,7 +178,7 @@ def main():
         display_frame = cv2.resize(frame_bgr, (DISPLAY_WIDTH, DISPLAY_HEIGHT))
 
         # Scrivi la predizione sul frame
-        text = f"{predicted_class_name} ({prediction_confidence*100:.1f}%)"
+        text = f"{predicted_class_name} ({prediction_confidence*100:.1f}%){exit_label}"
         cv2.putText(display_frame, text, (20, 40), font, 1, (0, 255, 0), 2, cv2.LINE_AA)
 
         cv2.imshow("Test Modello TFLite - Webcam RTSP", display_frame)
@@ -140,6 +190,8 @@ def main():
 
     cap.release()
     cv2.destroyAllWindows()
+    if early_exit_runner is not None:
+        early_exit_runner.report()
     print("\nRisorse rilasciate. Test terminato.")
 
 if __name__ == '__main__':
@@ -1,13 +1,107 @@
+import os
+import time
 import numpy as np
 import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras import layers
+from evaluate_models import compute_metrics, predict_keras, predict_tflite
+from model_conversion import convert_qat_model, convert_to_int8, NUM_CALIBRATION_IMAGES
+import matplotlib
+matplotlib.use("Agg") # Backend senza finestre: i grafici vengono salvati su file (addestramento anche headless)
 import matplotlib.pyplot as plt
 
 # --- Parametri ---
 PREPROCESSED_DATA_FILE = "preprocessed_dataset.npz"
+KERAS_MODEL_PATH = "hand_gesture_model.keras"
+HISTORY_PLOT_PATH = "training_history.png" # Grafico di accuracy/loss salvato al termine dell'addestramento
+
+# --- Prestazioni di addestramento (host solo CPU) ---
+# Compila il passo di addestramento con XLA (jit_compile). Disattivato di default: su un host a 1 CPU con questo
+# modello XLA è risultato 2.5-3.5 volte più lento (~110-130 contro ~315-385 campioni/s). Attivarlo solo dopo aver
+# confrontato i campioni/s stampati da EpochTimingCallback sul proprio host.
+USE_XLA = False
+INTRA_OP_THREADS = 0      # Thread usati dentro un singolo operatore (0 = scelta automatica di TensorFlow)
+INTER_OP_THREADS = 0      # Operatori indipendenti eseguiti in parallelo (0 = scelta automatica di TensorFlow)
+
+# Batch più grandi possono sfruttare meglio la CPU; il learning rate viene scalato linearmente rispetto al batch
+# di riferimento. Di default si usa il batch di riferimento (addestramento invariato): con ~280 immagini di training
+# un batch di 128 lascerebbe solo 2-3 passi dell'ottimizzatore per epoca.
+BASE_BATCH_SIZE = 32
+BASE_LEARNING_RATE = 1e-3 # Learning rate di default di Adam per BASE_BATCH_SIZE
+BATCH_SIZE = BASE_BATCH_SIZE
+
+# Early stopping su val_loss al posto di un numero fisso di epoche
+MAX_EPOCHS = 100
+EARLY_STOPPING_PATIENCE = 8
+
+# Checkpoint per riprendere un addestramento interrotto (la cartella viene rimossa a fine addestramento)
+CHECKPOINT_DIR = "training_checkpoints"
+
+# --- Modello a uscita anticipata (early exit) ---
+# Se True si addestra, insieme alla testa principale, un classificatore ausiliario dopo il primo blocco Conv/Pool:
+# a runtime (test_tflite_model.py) i frame "facili" si fermano lì senza eseguire i layer più costosi.
+EARLY_EXIT = False
+EARLY_EXIT_LOSS_WEIGHT = 0.3 # Peso della loss della testa anticipata rispetto a quella principale (1.0)
+EARLY_EXIT_MODEL_PATH = "hand_gesture_model_early_exit.keras"
+# I nomi dei layer della parte dopo l'uscita anticipata sono in EARLY_EXIT_TAIL_LAYERS (model_conversion.py)
+
+# --- Quantization-aware training (QAT) per il deploy INT8 ---
+# Se True, dopo l'addestramento il modello (build_model, non early exit) viene ri-addestrato per qualche epoca
+# simulando la quantizzazione int8 (fake-quant) di pesi e attivazioni, così impara a compensarne l'errore.
+# Viene esportato direttamente in TFLite completamente int8 (input/output int8) e confrontato con il modello
+# float e con la quantizzazione post-addestramento (PTQ) dello stesso modello.
+QAT_FINE_TUNE = False
+# Se True non si addestra da zero: si carica il modello già addestrato (KERAS_MODEL_PATH) e si esegue solo il QAT
+QAT_FROM_SAVED_MODEL = False
+QAT_EPOCHS = 5
+QAT_LEARNING_RATE = 1e-4 # Basso: si parte da pesi già addestrati
+QAT_TFLITE_MODEL_PATH = "hand_gesture_model_qat_int8.tflite"
+PTQ_TFLITE_MODEL_PATH = "hand_gesture_model_ptq_int8.tflite"
 # --- Fine Parametri ---
 
+
+class EpochTimingCallback(keras.callbacks.Callback):
+    """
+    Registra il tempo di ogni epoca e i campioni di addestramento elaborati al secondo.
+    Il throughput considera solo la parte di addestramento: il cronometro si ferma quando inizia la validazione.
+    """
+
+    def __init__(self, num_samples):
+        super().__init__()
+        self.num_samples = num_samples
+        self.epoch_start_time = None
+        self.train_end_time = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start_time = time.perf_counter()
+        self.train_end_time = None
+
+    def on_test_begin(self, logs=None):
+        # Chiamato da fit() all'inizio della validazione di fine epoca
+        if self.epoch_start_time is not None and self.train_end_time is None:
+            self.train_end_time = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        end_time = time.perf_counter()
+        train_time = (self.train_end_time or end_time) - self.epoch_start_time
+        epoch_time = end_time - self.epoch_start_time
+        print(f"  Epoca {epoch + 1}: addestramento {train_time:.2f} s ({self.num_samples / train_time:.1f} campioni/s), "
+              f"totale con validazione {epoch_time:.2f} s")
+        if logs is not None:
+            logs['epoch_time'] = epoch_time
+            logs['train_time'] = train_time
+            logs['samples_per_second'] = self.num_samples / train_time
+
+
+def configure_threading():
+    """Imposta i thread di TensorFlow (va chiamata prima di eseguire qualsiasi operazione)."""
+    if INTRA_OP_THREADS > 0:
+        tf.config.threading.set_intra_op_parallelism_threads(INTRA_OP_THREADS)
+    if INTER_OP_THREADS > 0:
+        tf.config.threading.set_inter_op_parallelism_threads(INTER_OP_THREADS)
+    print(f"Thread TensorFlow: intra-op {tf.config.threading.get_intra_op_parallelism_threads() or 'auto'}, "
+          f"inter-op {tf.config.threading.get_inter_op_parallelism_threads() or 'auto'}")
+
 def load_data(file_path):
     """Carica i dati pre-elaborati."""
     print(f"Caricamento dati da: {file_path}")
@@ -30,7 +124,7 @@ def load_data(file_path):
     print(f"  Dimensioni immagini (H, W): ({img_height}, {img_width})")
     return train_images, train_labels, val_images, val_labels, class_names, img_height, img_width
 
-def build_model(input_shape, num_classes):
+def build_model(input_shape, num_classes, learning_rate=BASE_LEARNING_RATE, jit_compile=False):
     """Definisce un semplice modello CNN."""
     print(f"\nCostruzione del modello con input_shape: {input_shape} e num_classes: {num_classes}")
 
@@ -54,17 +148,175 @@ def build_model(input_shape, num_classes):
     # Compila il modello
     # Per la classificazione multi-classe con etichette intere, usa 'sparse_categorical_crossentropy'
     # Se le etichette fossero one-hot encoded, useresti 'categorical_crossentropy'
-    model.compile(optimizer='adam',
+    model.compile(optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
                   loss='sparse_categorical_crossentropy',
-                  metrics=['accuracy'])
+                  metrics=['accuracy'],
+                  jit_compile=jit_compile)
 
     model.summary() # Stampa un riassunto dell'architettura del modello
     return model
 
-def plot_training_history(history):
-    """Visualizza l'andamento di accuracy e loss durante l'addestramento."""
-    acc = history.history['accuracy']
-    val_acc = history.history['val_accuracy']
+def build_early_exit_model(input_shape, num_classes, learning_rate=BASE_LEARNING_RATE, jit_compile=False):
+    """
+    Stessa CNN di build_model() con una seconda uscita ('early_exit') dopo il primo blocco Conv/Pool.
+    Le due teste vengono addestrate insieme; la loss totale è main + EARLY_EXIT_LOSS_WEIGHT * early.
+    """
+    print(f"\nCostruzione del modello early exit con input_shape: {input_shape} e num_classes: {num_classes}")
+
+    inputs = keras.Input(shape=input_shape, name="image")
+    x = layers.Conv2D(16, (3, 3), activation='relu', name="block1_conv")(inputs)
+    features = layers.MaxPooling2D((2, 2), name="block1_pool")(x)
+
+    # Testa anticipata: molto economica. Si riduce la mappa 47x47 con un average pooling 4x4
+    # (non globale, perché per distinguere mano alzata/abbassata conta la posizione)
+    early = layers.AveragePooling2D((4, 4), name="early_pool")(features)
+    early = layers.Flatten(name="early_flatten")(early)
+    early_output = layers.Dense(num_classes, activation='softmax', name="early_exit")(early)
+
+    # Parte principale, identica a build_model()
+    x = layers.Conv2D(32, (3, 3), activation='relu', name="block2_conv")(features)
+    x = layers.MaxPooling2D((2, 2), name="block2_pool")(x)
+    x = layers.Flatten(name="flatten")(x)
+    x = layers.Dense(32, activation='relu', name="dense")(x)
+    main_output = layers.Dense(num_classes, activation='softmax', name="main_exit")(x)
+
+    model = keras.Model(inputs, {"early_exit": early_output, "main_exit": main_output})
+    model.compile(optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+                  loss={"early_exit": 'sparse_categorical_crossentropy', "main_exit": 'sparse_categorical_crossentropy'},
+                  loss_weights={"early_exit": EARLY_EXIT_LOSS_WEIGHT, "main_exit": 1.0},
+                  metrics={"early_exit": ['accuracy'], "main_exit": ['accuracy']},
+                  jit_compile=jit_compile)
+
+    model.summary()
+    return model
+
+def fake_quantize_kernel(kernel, per_channel):
+    """
+    Simula la quantizzazione dei pesi di TFLite: int8 simmetrica [-127, 127], per canale di output
+    per le convoluzioni e per tensore per i layer Dense (come fa il convertitore).
+    """
+    if not per_channel:
+        max_abs = tf.reduce_max(tf.abs(kernel))
+        return tf.quantization.fake_quant_with_min_max_vars(kernel, -max_abs, max_abs, num_bits=8, narrow_range=True)
+    max_abs = tf.reduce_max(tf.abs(tf.reshape(kernel, [-1, kernel.shape[-1]])), axis=0)
+    return tf.quantization.fake_quant_with_min_max_vars_per_channel(kernel, -max_abs, max_abs,
+                                                                    num_bits=8, narrow_range=True)
+
+class FakeQuantConv2D(layers.Conv2D):
+    """Conv2D che durante il QAT usa i pesi quantizzati (il gradiente passa invariato, straight-through)."""
+
+    def call(self, inputs):
+        outputs = self.convolution_op(inputs, fake_quantize_kernel(self.kernel, per_channel=True))
+        return self.activation(outputs + self.bias)
+
+class FakeQuantDense(layers.Dense):
+    """Dense che durante il QAT usa i pesi quantizzati."""
+
+    def call(self, inputs):
+        return self.activation(tf.matmul(inputs, fake_quantize_kernel(self.kernel, per_channel=False)) + self.bias)
+
+class ActivationFakeQuant(layers.Layer):
+    """
+    Simula la quantizzazione int8 per tensore di un'attivazione. Il range [min, max] è una media mobile
+    dei valori visti in addestramento (oppure fisso, per l'immagine in input e per l'output del softmax);
+    il convertitore TFLite lo usa come parametro di quantizzazione del tensore.
+    """
+
+    def __init__(self, fixed_range=None, momentum=0.99, **kwargs):
+        super().__init__(**kwargs)
+        self.fixed_range = fixed_range
+        self.momentum = momentum
+
+    def build(self, input_shape):
+        self.range_min = self.add_weight(name="range_min", shape=(), initializer="zeros", trainable=False)
+        self.range_max = self.add_weight(name="range_max", shape=(), initializer="ones", trainable=False)
+        self.initialized = self.add_weight(name="initialized", shape=(), initializer="zeros", trainable=False)
+
+    def call(self, inputs, training=None):
+        if self.fixed_range is not None:
+            return tf.quantization.fake_quant_with_min_max_args(inputs, *self.fixed_range, num_bits=8)
+        if training:
+            # Il range deve contenere lo zero, che così è rappresentato esattamente
+            batch_min = tf.minimum(tf.reduce_min(inputs), 0.0)
+            batch_max = tf.maximum(tf.reduce_max(inputs), 0.0)
+            # Al primo batch il range viene inizializzato direttamente, poi aggiornato con la media mobile
+            momentum = self.momentum * self.initialized
+            self.range_min.assign(momentum * self.range_min + (1 - momentum) * batch_min)
+            self.range_max.assign(momentum * self.range_max + (1 - momentum) * batch_max)
+            self.initialized.assign(1.0)
+        return tf.quantization.fake_quant_with_min_max_vars(inputs, self.range_min, self.range_max, num_bits=8)
+
+def build_qat_model(model):
+    """
+    Copia del modello di build_model() con i fake-quant: pesi di Conv2D/Dense quantizzati e un
+    ActivationFakeQuant sull'input e dopo ogni Conv2D/Dense (pooling e flatten non cambiano la quantizzazione).
+    Il softmax viene separato dal Dense finale perché anche i logit in ingresso vanno quantizzati.
+    I pesi di partenza sono quelli del modello addestrato.
+    """
+    qat_layers = [keras.Input(shape=model.input_shape[1:]), ActivationFakeQuant(fixed_range=(0.0, 1.0), name="input_quant")]
+    weighted_pairs = []
+    for layer in model.layers:
+        if isinstance(layer, (layers.Conv2D, layers.Dense)):
+            quantized_class = FakeQuantConv2D if isinstance(layer, layers.Conv2D) else FakeQuantDense
+            config = layer.get_config()
+            if config['activation'] == 'softmax':
+                # In TFLite int8 l'output del softmax ha scala fissa 1/256, cioè range [0, 255/256]
+                quantized_layer = quantized_class.from_config({**config, 'activation': 'linear'})
+                qat_layers += [quantized_layer, ActivationFakeQuant(name=layer.name + "_logits_quant"),
+                               layers.Softmax(), ActivationFakeQuant(fixed_range=(0.0, 255 / 256), name=layer.name + "_quant")]
+            else:
+                quantized_layer = quantized_class.from_config(config)
+                qat_layers += [quantized_layer, ActivationFakeQuant(name=layer.name + "_quant")]
+            weighted_pairs.append((layer, quantized_layer))
+        else:
+            qat_layers.append(layer.__class__.from_config(layer.get_config()))
+
+    qat_model = keras.Sequential(qat_layers, name="qat_model")
+    for layer, quantized_layer in weighted_pairs:
+        quantized_layer.set_weights(layer.get_weights())
+    return qat_model
+
+def run_quantization_aware_training(model, train_images, train_labels, val_images, val_labels):
+    """
+    Quantizza il modello float addestrato in due modi e confronta l'accuracy di validazione:
+    - PTQ: quantizzazione post-addestramento con dataset di calibrazione (model_conversion.py)
+    - QAT: fine-tuning con fake-quant per QAT_EPOCHS epoche, poi conversione diretta in int8
+    """
+    print("\nQuantizzazione post-addestramento (PTQ) INT8...")
+    ptq_tflite_model = convert_to_int8(model, train_images[:NUM_CALIBRATION_IMAGES])
+    with open(PTQ_TFLITE_MODEL_PATH, 'wb') as f:
+        f.write(ptq_tflite_model)
+    print(f"Modello PTQ salvato come: {PTQ_TFLITE_MODEL_PATH} ({len(ptq_tflite_model) / 1024:.2f} KB)")
+
+    print(f"\nQuantization-aware training: {QAT_EPOCHS} epoche, learning rate {QAT_LEARNING_RATE:g}")
+    qat_model = build_qat_model(model)
+    qat_model.compile(optimizer=keras.optimizers.Adam(learning_rate=QAT_LEARNING_RATE),
+                      loss='sparse_categorical_crossentropy',
+                      metrics=['accuracy'])
+    qat_model.fit(train_images, train_labels,
+                  epochs=QAT_EPOCHS,
+                  batch_size=BATCH_SIZE,
+                  validation_data=(val_images, val_labels),
+                  callbacks=[EpochTimingCallback(len(train_images))])
+
+    qat_tflite_model = convert_qat_model(qat_model)
+    with open(QAT_TFLITE_MODEL_PATH, 'wb') as f:
+        f.write(qat_tflite_model)
+    print(f"Modello QAT salvato come: {QAT_TFLITE_MODEL_PATH} ({len(qat_tflite_model) / 1024:.2f} KB)")
+
+    num_classes = model.output_shape[-1]
+    float_probabilities, _ = predict_keras(model, val_images)
+    float_accuracy = compute_metrics(val_labels, np.argmax(float_probabilities, axis=1), num_classes)['accuracy']
+    print(f"\nAccuracy di validazione: float {float_accuracy * 100:.2f}%")
+    for name, tflite_path in [("PTQ int8", PTQ_TFLITE_MODEL_PATH), ("QAT int8", QAT_TFLITE_MODEL_PATH)]:
+        probabilities, _ = predict_tflite(tflite_path, val_images)
+        accuracy = compute_metrics(val_labels, np.argmax(probabilities, axis=1), num_classes)['accuracy']
+        print(f"  {name}: {accuracy * 100:.2f}% ({(accuracy - float_accuracy) * 100:+.2f} punti rispetto al float)")
+
+def plot_training_history(history, output_path=HISTORY_PLOT_PATH, accuracy_key='accuracy'):
+    """Salva su file l'andamento di accuracy e loss durante l'addestramento."""
+    acc = history.history[accuracy_key]
+    val_acc = history.history['val_' + accuracy_key]
     loss = history.history['loss']
     val_loss = history.history['val_loss']
     epochs_range = range(len(acc))
@@ -88,39 +340,91 @@ def plot_training_history(history):
     plt.ylabel('Loss')
 
     plt.tight_layout()
-    plt.show()
+    plt.savefig(output_path)
+    plt.close()
+    print(f"Grafico dell'addestramento salvato come: {output_path}")
 
 def main():
+    configure_threading()
+
     # Carica i dati pre-elaborati
     train_images, train_labels, val_images, val_labels, class_names, img_height, img_width = load_data(PREPROCESSED_DATA_FILE)
 
     input_shape = (img_height, img_width, 1) # Altezza, Larghezza, Canali (1 per scala di grigi)
     num_classes = len(class_names)
 
+    if QAT_FROM_SAVED_MODEL:
+        print(f"\nCaricamento del modello Keras addestrato da: {KERAS_MODEL_PATH} (solo quantization-aware training)")
+        try:
+            model = keras.models.load_model(KERAS_MODEL_PATH)
+        except (OSError, ValueError) as e:
+            print(f"ERRORE durante il caricamento del modello Keras: {e}")
+            print("Esegui prima l'addestramento completo (QAT_FROM_SAVED_MODEL = False).")
+            return
+        run_quantization_aware_training(model, train_images, train_labels, val_images, val_labels)
+        return
+
     # Costruisci il modello
-    model = build_model(input_shape, num_classes)
+    # Regola di scalatura lineare: raddoppiando il batch si raddoppia il learning rate
+    learning_rate = BASE_LEARNING_RATE * BATCH_SIZE / BASE_BATCH_SIZE
+    print(f"Batch size: {BATCH_SIZE}, learning rate: {learning_rate:g}, XLA: {'attivo' if USE_XLA else 'disattivo'}")
+    if EARLY_EXIT:
+        model = build_early_exit_model(input_shape, num_classes, learning_rate=learning_rate, jit_compile=USE_XLA)
+        # Entrambe le teste imparano le stesse etichette
+        train_targets = {"early_exit": train_labels, "main_exit": train_labels}
+        val_targets = {"early_exit": val_labels, "main_exit": val_labels}
+        model_path, checkpoint_dir, accuracy_key = EARLY_EXIT_MODEL_PATH, CHECKPOINT_DIR + "_early_exit", 'main_exit_accuracy'
+    else:
+        model = build_model(input_shape, num_classes, learning_rate=learning_rate, jit_compile=USE_XLA)
+        train_targets, val_targets = train_labels, val_labels
+        model_path, checkpoint_dir, accuracy_key = KERAS_MODEL_PATH, CHECKPOINT_DIR, 'accuracy'
 
     # Addestra il modello
     print("\nInizio addestramento del modello...")
-    # NUM_EPOCHS determina per quante volte il modello vedrà l'intero dataset di addestramento.
-    # Inizia con un numero moderato (es. 10-20) e poi puoi aumentarlo se necessario.
-    # BATCH_SIZE è il numero di campioni elaborati prima di aggiornare i pesi del modello.
-    NUM_EPOCHS = 15
-    BATCH_SIZE = 32
-
-    history = model.fit(train_images, train_labels,
-                        epochs=NUM_EPOCHS,
+    # L'addestramento si ferma quando val_loss non migliora per EARLY_STOPPING_PATIENCE epoche
+    # (al massimo MAX_EPOCHS) e vengono ripristinati i pesi migliori.
+    # BackupAndRestore salva lo stato a ogni epoca: rilanciando lo script dopo un'interruzione
+    # l'addestramento riprende dall'ultima epoca completata.
+    callbacks = [
+        EpochTimingCallback(len(train_images)),
+        keras.callbacks.EarlyStopping(monitor='val_loss', patience=EARLY_STOPPING_PATIENCE,
+                                      restore_best_weights=True, verbose=1),
+        keras.callbacks.BackupAndRestore(backup_dir=checkpoint_dir),
+    ]
+    if os.path.isdir(checkpoint_dir):
+        print(f"Trovato checkpoint in '{checkpoint_dir}': l'addestramento riprenderà da lì.")
+
+    start_time = time.perf_counter()
+    history = model.fit(train_images, train_targets,
+                        epochs=MAX_EPOCHS,
                         batch_size=BATCH_SIZE,
-                        validation_data=(val_images, val_labels))
+                        validation_data=(val_images, val_targets),
+                        callbacks=callbacks)
+    elapsed = time.perf_counter() - start_time
 
-    print("Addestramento completato.")
+    num_epochs = len(history.history['loss'])
+    # Il throughput medio esclude il tempo di validazione (vedi EpochTimingCallback)
+    train_time = sum(history.history['train_time'])
+    print(f"Addestramento completato: {num_epochs} epoche in {elapsed:.1f} s "
+          f"({num_epochs * len(train_images) / train_time:.1f} campioni/s in media, validazione esclusa).")
+
+    if EARLY_EXIT:
+        best_epoch = int(np.argmin(history.history['val_loss']))
+        print(f"Validation accuracy: uscita anticipata {history.history['val_early_exit_accuracy'][best_epoch]:.4f}, "
+              f"uscita principale {history.history['val_main_exit_accuracy'][best_epoch]:.4f}")
 
     # Salva il modello Keras addestrato (formato .keras)
-    model.save("hand_gesture_model.keras")
-    print(f"\nModello Keras addestrato salvato come: hand_gesture_model.keras")
+    model.save(model_path)
+    print(f"\nModello Keras addestrato salvato come: {model_path}")
 
     # Visualizza la cronologia dell'addestramento
-    plot_training_history(history)
+    plot_training_history(history, accuracy_key=accuracy_key)
+
+    if QAT_FINE_TUNE:
+        if EARLY_EXIT:
+            print("ATTENZIONE: il quantization-aware training non è supportato per il modello early exit. Salto.")
+        else:
+            run_quantization_aware_training(model, train_images, train_labels, val_images, val_labels)
 
 if __name__ == '__main__':
     # Assicurati che matplotlib sia installato se non l'hai già fatto:
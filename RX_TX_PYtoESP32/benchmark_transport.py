@@ -0,0 +1,110 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import requests
+import frame_TX_to_ESP32 as sender
+from stream_protocol import StreamClient, StandInServer
+
+# --- Parametri del Benchmark ---
+# Confronta il trasporto HTTP attuale (una POST per frame) con lo streaming TCP persistente,
+# usando server locali che simulano l'ESP32 (nessun hardware necessario).
+NUM_FRAMES = 300
+FRAME_WIDTH = 160          # Risoluzione dello stream impostata in ffmpeg
+FRAME_HEIGHT = 120
+PAYLOAD_MODES = ["jpeg", "tensor"]
+DEVICE_PROCESSING_TIME = 0.0  # Secondi di "elaborazione" simulata sull'ESP32 per ogni frame
+STREAM_CREDITS = 4            # Frame che il dispositivo simulato accetta in coda
+CREDIT_WAIT_RETRIES = 5       # Attese da 1 s di un credito prima di considerare bloccato il dispositivo simulato
+# --- Fine Parametri ---
+
+
+class StandInHTTPHandler(BaseHTTPRequestHandler):
+    """Simula l'handler /upload_frame dello sketch frame_RX_to_py.ino."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if DEVICE_PROCESSING_TIME > 0:
+            time.sleep(DEVICE_PROCESSING_TIME)
+        response = f"Frame ricevuto con successo dall'ESP32! ({len(body)} byte)".encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass  # Niente log per ogni richiesta durante il benchmark
+
+
+def make_test_frame():
+    """Frame sintetico con gradiente e rumore (si comprime in JPEG in modo realistico)."""
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 200, FRAME_WIDTH, dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 12, (FRAME_HEIGHT, FRAME_WIDTH, 3))
+    return np.clip(gradient + noise, 0, 255).astype(np.uint8)
+
+
+def benchmark_http(payload, content_type):
+    """Invia NUM_FRAMES frame con una POST ciascuno, come frame_TX_to_ESP32.py. Restituisce (frame/s, latenze)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHTTPHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/upload_frame"
+
+    latencies = []
+    start_time = time.perf_counter()
+    for _ in range(NUM_FRAMES):
+        sent_time = time.perf_counter()
+        response = requests.post(url, data=payload, headers={'Content-Type': content_type}, timeout=3)
+        response.text  # Come nello script originale, il corpo della risposta viene letto
+        latencies.append(time.perf_counter() - sent_time)
+    elapsed = time.perf_counter() - start_time
+
+    server.shutdown()
+    server.server_close()
+    return NUM_FRAMES / elapsed, latencies
+
+
+def benchmark_stream(payload):
+    """Invia NUM_FRAMES frame sulla connessione persistente, rispettando i crediti. Restituisce (frame/s, latenze)."""
+    server = StandInServer(initial_credits=STREAM_CREDITS, processing_time=DEVICE_PROCESSING_TIME).start()
+    client = StreamClient(server.host, server.port)
+
+    start_time = time.perf_counter()
+    for _ in range(NUM_FRAMES):
+        # Nel benchmark si attende il credito invece di scartare il frame, per confrontare lo stesso numero di frame
+        for _ in range(CREDIT_WAIT_RETRIES):
+            if client.send_frame(payload, wait_timeout=1.0) is not None:
+                break
+        else:
+            client.close()
+            server.stop()
+            raise TimeoutError(f"Nessun credito dal dispositivo simulato in {CREDIT_WAIT_RETRIES} s.")
+    client.wait_idle()
+    elapsed = time.perf_counter() - start_time
+
+    latencies = list(client.latencies)
+    client.close()
+    server.stop()
+    return NUM_FRAMES / elapsed, latencies
+
+
+def main():
+    frame = make_test_frame()
+    print(f"Benchmark trasporto: {NUM_FRAMES} frame {FRAME_WIDTH}x{FRAME_HEIGHT}, "
+          f"elaborazione simulata {DEVICE_PROCESSING_TIME * 1000:.1f} ms/frame, crediti {STREAM_CREDITS}")
+    print(f"{'Payload':<8} {'Trasporto':<10} {'Byte/frame':>10} {'Frame/s':>10} {'Latenza media':>14} {'Latenza p95':>12}")
+
+    for mode in PAYLOAD_MODES:
+        sender.payload_mode = mode
+        payload, content_type = sender.encode_payload(frame)
+        results = [("http", *benchmark_http(payload, content_type)),
+                   ("tcp", *benchmark_stream(payload))]
+        for transport, fps, latencies in results:
+            latencies_ms = np.array(latencies) * 1000
+            print(f"{mode:<8} {transport:<10} {len(payload):>10} {fps:>10.1f} "
+                  f"{latencies_ms.mean():>11.2f} ms {np.percentile(latencies_ms, 95):>9.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
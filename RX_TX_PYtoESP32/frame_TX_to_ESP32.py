@@ -1,8 +1,18 @@
 import cv2
+import numpy as np
+import os
 import time
 import signal
+import struct
 import sys
+import zlib
 import requests # Per inviare richieste HTTP
+from stream_protocol import StreamClient, DEFAULT_STREAM_PORT
+
+# Codice del modello (model_runtime.py: runtime TFLite leggero) in Modello_riconoscimento_base/codice_python
+MODEL_CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Modello_riconoscimento_base", "codice_python")
+sys.path.insert(0, MODEL_CODE_DIR)
+import model_runtime
 
 # --- Configurazione Essenziale ---
 # URL dello stream RTSP (dal tuo server mediamtx)
@@ -11,11 +21,50 @@ rtsp_url = "rtsp://localhost:8554/webcam_stream"
 # URL dell'endpoint sull'ESP32 che riceverà il frame
 esp32_target_url = "http://192.168.217.67:80/upload_frame"
 
+# Trasporto verso l'ESP32:
+# - "http": una richiesta POST per frame (header HTTP di richiesta e risposta a ogni frame)
+# - "tcp":  una sola connessione persistente con frame binari a lunghezza prefissata, risultati
+#           asincroni sullo stesso canale e controllo di flusso a crediti (vedi stream_protocol.py)
+transport_mode = "http"
+esp32_stream_host = "192.168.217.67"
+esp32_stream_port = DEFAULT_STREAM_PORT
+
+# Formato del payload inviato all'ESP32:
+# - "jpeg":   frame intero compresso in JPEG (l'ESP32 deve decodificarlo, ridimensionarlo e convertirlo in grigio)
+# - "tensor": il PC esegue gli stessi passi di preprocess_frame() (resize 96x96, scala di grigi) e invia
+#             direttamente il tensore di input quantizzato del modello: 9216 byte grezzi a dimensione fissa
+payload_mode = "jpeg"
 
 # Qualità della compressione JPEG (0-100, più alto è meglio ma più grande il file)
 jpeg_quality = 85
 # --- Fine Configurazione Essenziale ---
 
+# --- Configurazione Payload "tensor" ---
+# Modello deployato sull'ESP32 (lo stesso da cui export_firmware.py genera hand_gesture_model_data.h):
+# forma, tipo e quantizzazione del tensore vengono letti dai suoi dettagli di input, non copiati a mano.
+tensor_model_path = os.path.join(MODEL_CODE_DIR, "hand_gesture_model.tflite")
+# Valorizzati da load_tensor_input_spec() (kInputHeight/kInputWidth/kInputScale/kInputZeroPoint del firmware).
+# valore_quantizzato = round(pixel / 255 / scale) + zero_point
+# Per un modello con input float32 il tensore viaggia come uint8 con scale 1/255 e zero point 0
+# (i pixel grezzi: l'ESP32 ricava il float con scale * valore, senza inviare 4 byte per pixel).
+tensor_width = None
+tensor_height = None
+tensor_dtype = None          # "uint8" oppure "int8"
+tensor_scale = None
+tensor_zero_point = None
+# Compressione zlib senza perdita (livello 1 = la più veloce); l'ESP32 può decomprimere con miniz/tinfl della ROM
+tensor_compression = False
+
+# Header (little-endian, 24 byte) che precede i dati del tensore:
+#   magic "GTNS" | versione u8 | dtype u8 (0 = uint8, 1 = int8) | canali u8 | flag u8 (bit 0 = zlib)
+#   altezza u16 | larghezza u16 | scale f32 | zero_point i32 | lunghezza dati u32
+TENSOR_HEADER_FORMAT = "<4sBBBBHHfiI"
+TENSOR_MAGIC = b"GTNS"
+TENSOR_VERSION = 1
+TENSOR_DTYPE_CODES = {"uint8": 0, "int8": 1}
+TENSOR_FLAG_ZLIB = 0x01
+# --- Fine Configurazione Payload "tensor" ---
+
 # --- Configurazione Opzionale Visualizzazione Locale ---
 # Se vuoi visualizzare i frame anche sul PC dove gira questo script
 enable_local_display = True
@@ -35,13 +84,90 @@ def signal_handler_function(sig, frame_signal):
     print("\nSegnale di interruzione (Ctrl+C) ricevuto. Uscita in corso...")
     global stop_program_flag
     stop_program_flag = True
-
-signal.signal(signal.SIGINT, signal_handler_function)
 # --- Fine Gestione Uscita con Ctrl+C ---
 
+def load_tensor_input_spec(model_path=None):
+    """Legge forma, tipo e quantizzazione dell'input dal .tflite deployato e imposta i parametri tensor_*."""
+    global tensor_width, tensor_height, tensor_dtype, tensor_scale, tensor_zero_point
+    interpreter_class, _ = model_runtime.load_interpreter_class()
+    interpreter = interpreter_class(model_path=model_path or tensor_model_path)
+    input_detail = interpreter.get_input_details()[0]
+    _, tensor_height, tensor_width, _ = [int(d) for d in input_detail['shape']]
+    if input_detail['dtype'] == np.float32:
+        tensor_dtype, tensor_scale, tensor_zero_point = "uint8", 1.0 / 255.0, 0
+    else:
+        tensor_dtype = np.dtype(input_detail['dtype']).name
+        scale, zero_point = input_detail['quantization']
+        tensor_scale, tensor_zero_point = float(scale), int(zero_point)
+
+def preprocess_frame_to_tensor(frame):
+    """Stessi passi di preprocess_frame() (resize + scala di grigi), quantizzati nel tipo di input del modello."""
+    if tensor_dtype is None:
+        load_tensor_input_spec()
+    img_resized = cv2.resize(frame, (tensor_width, tensor_height))
+    img_gray = cv2.cvtColor(img_resized, cv2.COLOR_BGR2GRAY)
+    info = np.iinfo(tensor_dtype)
+    if abs(tensor_scale - 1.0 / 255.0) < 1e-9:
+        # Caso comune: con scale 1/255 la quantizzazione è solo uno spostamento dello zero point
+        quantized = img_gray.astype(np.int16) + tensor_zero_point
+    else:
+        quantized = np.round(img_gray.astype(np.float32) / 255.0 / tensor_scale) + tensor_zero_point
+    return np.clip(quantized, info.min, info.max).astype(tensor_dtype)
+
+def encode_tensor_payload(tensor):
+    """Serializza il tensore con l'header binario (ed eventuale compressione zlib)."""
+    data = tensor.tobytes()
+    flags = 0
+    if tensor_compression:
+        data = zlib.compress(data, 1)
+        flags |= TENSOR_FLAG_ZLIB
+    header = struct.pack(TENSOR_HEADER_FORMAT, TENSOR_MAGIC, TENSOR_VERSION, TENSOR_DTYPE_CODES[tensor_dtype],
+                         1, flags, tensor_height, tensor_width, tensor_scale, tensor_zero_point, len(data))
+    return header + data
+
+def encode_payload(frame):
+    """Restituisce (bytes, content_type) da inviare all'ESP32 secondo payload_mode, oppure None se la codifica fallisce."""
+    if payload_mode == "tensor":
+        return encode_tensor_payload(preprocess_frame_to_tensor(frame)), 'application/octet-stream'
+
+    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+    result, encoded_jpeg = cv2.imencode('.jpg', frame, encode_param)
+    if not result:
+        return None
+    return encoded_jpeg.tobytes(), 'image/jpeg'
+
+def send_frame_http(payload, content_type):
+    """Invia un frame con una richiesta HTTP POST e stampa la risposta dell'ESP32."""
+    try:
+        response = requests.post(
+            esp32_target_url,
+            data=payload,
+            headers={'Content-Type': content_type},
+            timeout=3 # Timeout in secondi (es. 3 secondi)
+        )
+
+        # Controlla la risposta dall'ESP32 (opzionale ma utile per debug)
+        if response.status_code == 200:
+            print(f"Frame inviato con successo ({len(payload)} byte). Risposta ESP32: {response.text[:100]}") # Mostra i primi 100 caratteri della risposta
+        else:
+            print(f"ERRORE invio frame. Status: {response.status_code}, Risposta ESP32: {response.text[:200]}")
+
+    except requests.exceptions.RequestException as e:
+        print(f"ERRORE di connessione/richiesta all'ESP32: {e}")
+        # Potresti voler attendere un po' prima di riprovare per non sovraccaricare di log
+        time.sleep(1)
+
+def print_stream_result(frame_id, result, latency):
+    """Callback chiamata dal thread di ricezione quando l'ESP32 restituisce il risultato di un frame."""
+    latency_text = f"{latency * 1000:.1f} ms" if latency is not None else "n/d"
+    print(f"Risultato frame {frame_id} (latenza {latency_text}): {result[:100]}")
+
 def main():
     global stop_program_flag # Necessario se modifichi stop_program_flag in una funzione annidata (non il caso qui, ma buona pratica)
 
+    # Registrato qui e non all'import: benchmark_transport.py e multi_device_TX_to_ESP32.py importano questo modulo
+    signal.signal(signal.SIGINT, signal_handler_function)
+
     # Inizializza la cattura video dall'URL RTSP
     video_capture = cv2.VideoCapture(rtsp_url)
 
@@ -50,7 +176,30 @@ def main():
         sys.exit(1)
 
     print(f"Connesso correttamente allo stream RTSP: {rtsp_url}")
-    print(f"I frame verranno inviati (come JPEG qualità {jpeg_quality}) a: {esp32_target_url}")
+
+    stream_client = None
+    if transport_mode == "tcp":
+        destination = f"tcp://{esp32_stream_host}:{esp32_stream_port}"
+        try:
+            stream_client = StreamClient(esp32_stream_host, esp32_stream_port, on_result=print_stream_result)
+        except OSError as e:
+            print(f"ERRORE: Impossibile aprire la connessione di streaming con l'ESP32 ({destination}): {e}")
+            video_capture.release()
+            sys.exit(1)
+    else:
+        destination = esp32_target_url
+
+    if payload_mode == "tensor":
+        try:
+            load_tensor_input_spec()
+        except (OSError, ValueError) as e:
+            print(f"ERRORE: Impossibile leggere l'input del modello {tensor_model_path}: {e}")
+            video_capture.release()
+            sys.exit(1)
+        print(f"I frame verranno inviati come tensore {tensor_dtype} {tensor_height}x{tensor_width}x1 "
+              f"(scale {tensor_scale:.6g}, zero point {tensor_zero_point}, compressione zlib: {'sì' if tensor_compression else 'no'}) a: {destination}")
+    else:
+        print(f"I frame verranno inviati (come JPEG qualità {jpeg_quality}) a: {destination}")
     if enable_local_display:
         print(f"La visualizzazione locale è attiva sulla finestra: '{local_display_window_name}'")
     print("\nAvvio elaborazione stream. Premi Ctrl+C nel terminale per uscire.")
@@ -71,33 +220,25 @@ def main():
 
         # --- Elaborazione del Frame per l'invio ---
         # Il frame_data letto ha le dimensioni definite in ffmpeg (es. 160x120)
-        # Codifica il frame in JPEG
-        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
-        result, encoded_jpeg = cv2.imencode('.jpg', frame_data, encode_param)
+        # Codifica il frame in JPEG oppure nel tensore di input del modello (vedi payload_mode)
+        encoded = encode_payload(frame_data)
 
-        if not result:
-            print("ERRORE: Durante la codifica del frame in JPEG.")
+        if encoded is None:
+            print("ERRORE: Durante la codifica del frame.")
             continue
+        payload, content_type = encoded
 
-        # --- Invio del frame JPEG all'ESP32 ---
-        try:
-            response = requests.post(
-                esp32_target_url,
-                data=encoded_jpeg.tobytes(),
-                headers={'Content-Type': 'image/jpeg'},
-                timeout=3 # Timeout in secondi (es. 3 secondi)
-            )
-
-            # Controlla la risposta dall'ESP32 (opzionale ma utile per debug)
-            if response.status_code == 200:
-                print(f"Frame inviato con successo. Risposta ESP32: {response.text[:100]}") # Mostra i primi 100 caratteri della risposta
-            else:
-                print(f"ERRORE invio frame. Status: {response.status_code}, Risposta ESP32: {response.text[:200]}")
-
-        except requests.exceptions.RequestException as e:
-            print(f"ERRORE di connessione/richiesta all'ESP32: {e}")
-            # Potresti voler attendere un po' prima di riprovare per non sovraccaricare di log
-            time.sleep(1)
+        # --- Invio del frame all'ESP32 ---
+        if stream_client is not None:
+            # Il risultato arriva in modo asincrono (print_stream_result); senza crediti il frame viene scartato
+            try:
+                if stream_client.send_frame(payload) is None:
+                    print("Frame scartato: l'ESP32 non ha crediti disponibili (sta ancora elaborando).")
+            except (ConnectionError, OSError) as e:
+                print(f"ERRORE: Connessione di streaming con l'ESP32 interrotta: {e}")
+                stop_program_flag = True
+        else:
+            send_frame_http(payload, content_type)
 
 
         # --- Visualizzazione Locale (Opzionale) ---
@@ -120,6 +261,10 @@ def main():
 
     # --- Pulizia ---
     print("\nRilascio risorse...")
+    if stream_client is not None:
+        print(f"Streaming: {stream_client.frames_sent} frame inviati, {stream_client.frames_dropped} scartati per mancanza di crediti, "
+              f"{stream_client.results_lost} senza risultato.")
+        stream_client.close()
     video_capture.release()
     if enable_local_display:
         cv2.destroyAllWindows()
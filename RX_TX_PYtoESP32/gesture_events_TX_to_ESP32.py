@@ -0,0 +1,254 @@
+import cv2
+import numpy as np
+import os
+import time
+import signal
+import sys
+import threading
+import frame_TX_to_ESP32 as frame_sender
+from stream_protocol import (StreamClient, StandInServer, DEFAULT_STREAM_PORT, FRAME_ID_SIZE,
+                             MESSAGE_HEADER_SIZE)
+
+# Codice del modello (model_runtime.py: runtime TFLite leggero e metadati) in Modello_riconoscimento_base/codice_python
+MODEL_CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Modello_riconoscimento_base", "codice_python")
+sys.path.insert(0, MODEL_CODE_DIR)
+import model_runtime
+
+# --- Configurazione Essenziale ---
+# Modalità "inferenza sul PC": il PC esegue il modello TFLite sullo stream RTSP (come test_tflite_model.py)
+# e invia all'ESP32 solo eventi compatti (classe, confidenza, timestamp) invece di ogni frame.
+rtsp_url = "rtsp://localhost:8554/webcam_stream"
+
+# Connessione di streaming con l'ESP32 (stesso protocollo di frame_TX_to_ESP32.py con transport_mode = "tcp")
+esp32_stream_host = "192.168.217.67"
+esp32_stream_port = DEFAULT_STREAM_PORT
+# Se True avvia un server locale che simula l'ESP32 (per misurare latenza e banda senza hardware)
+use_stand_in_server = False
+
+# Modello e metadati prodotti in Modello_riconoscimento_base/codice_python
+model_dir = MODEL_CODE_DIR
+tflite_model_path = os.path.join(model_dir, "hand_gesture_model.tflite")
+preprocessed_data_file = os.path.join(model_dir, "preprocessed_dataset.npz")
+
+# Un evento viene inviato quando la classe predetta cambia o quando la confidenza attraversa la soglia
+# (in salita: gesto riconosciuto; in discesa: gesto rilasciato). L'ESP32 riceve la confidenza nell'evento
+# e decide se attuare.
+event_confidence_threshold = 0.80
+# Ogni quanti secondi stampare il confronto di banda e latenza con la modalità a streaming di frame
+report_interval = 5.0
+# Per quel confronto si codifica come nella modalità a frame solo un frame ogni N e si estrapola
+# (codificarli tutti aggiungerebbe lavoro per frame proprio alla modalità pensata per risparmiarlo)
+frame_mode_sample_interval = 30
+# Se True i frame campionati vengono anche inviati all'ESP32 come MSG_FRAME (se c'è un credito): la loro
+# latenza codifica -> risultato è la latenza gesto -> attuazione della modalità a frame, misurata sullo
+# stesso collegamento. I loro byte non vengono contati nella banda degli eventi.
+measure_frame_mode_latency = True
+# --- Fine Configurazione Essenziale ---
+
+
+# --- Gestione Uscita con Ctrl+C ---
+stop_program_flag = False
+
+def signal_handler_function(sig, frame_signal):
+    print("\nSegnale di interruzione (Ctrl+C) ricevuto. Uscita in corso...")
+    global stop_program_flag
+    stop_program_flag = True
+# --- Fine Gestione Uscita con Ctrl+C ---
+
+
+class GestureEventStats:
+    """Confronta banda e latenza gesto -> attuazione degli eventi con quelle dello streaming di frame."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.capture_times = {}  # id evento -> istante di acquisizione del frame che l'ha generato
+        self.latencies = []
+        self.frames_seen = 0
+        self.sampled_frames = 0
+        self.sampled_frame_bytes = 0  # Byte dei frame campionati nella modalità a streaming di frame
+        self.frame_start_times = {}  # id frame di misura -> istante di inizio codifica
+        self.frame_latencies = []
+        self.measurement_bytes_sent = 0  # Byte dei frame di misura (da escludere dalla banda degli eventi)
+        self.start_time = time.perf_counter()
+
+    def expect(self, event_id, capture_time):
+        """Registra l'evento in attesa di conferma (chiamata da StreamClient prima dell'invio)."""
+        with self.lock:
+            self.capture_times[event_id] = capture_time
+
+    def expect_frame(self, frame_id, start_time):
+        """Registra un frame di misura in attesa del risultato."""
+        with self.lock:
+            self.frame_start_times[frame_id] = start_time
+
+    def add_frame(self, frame, stream_client):
+        """
+        Conta il frame; uno ogni frame_mode_sample_interval viene codificato per stimare la banda dei frame
+        e, con measure_frame_mode_latency, inviato all'ESP32 per misurare la latenza della modalità a frame.
+        """
+        self.frames_seen += 1
+        if (self.frames_seen - 1) % frame_mode_sample_interval != 0:
+            return
+        start_time = time.perf_counter()
+        encoded = frame_sender.encode_payload(frame)
+        if encoded is None:
+            return
+        # Payload + header del messaggio + id frame, come nella modalità a streaming
+        message_bytes = len(encoded[0]) + MESSAGE_HEADER_SIZE + FRAME_ID_SIZE
+        self.sampled_frames += 1
+        self.sampled_frame_bytes += message_bytes
+        if measure_frame_mode_latency:
+            frame_id = stream_client.send_frame(encoded[0], on_id=lambda frame_id: self.expect_frame(frame_id, start_time))
+            if frame_id is not None:
+                self.measurement_bytes_sent += message_bytes
+
+    def frame_mode_bytes(self):
+        """Stima dei byte che la modalità a streaming di frame avrebbe inviato finora."""
+        if self.sampled_frames == 0:
+            return 0
+        return self.sampled_frame_bytes / self.sampled_frames * self.frames_seen
+
+    def on_result(self, event_id, result, _latency):
+        """Callback del thread di ricezione: l'ESP32 ha confermato l'attuazione dell'evento."""
+        with self.lock:
+            capture_time = self.capture_times.pop(event_id, None)
+            frame_start_time = self.frame_start_times.pop(event_id, None)
+        if frame_start_time is not None:
+            self.frame_latencies.append(time.perf_counter() - frame_start_time)
+            return
+        if capture_time is None:
+            return
+        latency = time.perf_counter() - capture_time
+        self.latencies.append(latency)
+        print(f"Evento {event_id} attuato: {result[:80]} (latenza gesto -> attuazione {latency * 1000:.1f} ms)")
+
+    def report(self, bytes_sent):
+        """Stampa byte/s e latenza degli eventi rispetto alla modalità a streaming di frame."""
+        event_bytes = bytes_sent - self.measurement_bytes_sent
+        elapsed = max(time.perf_counter() - self.start_time, 1e-6)
+        frame_mode_bytes = self.frame_mode_bytes()
+        print(f"Banda: eventi {event_bytes / elapsed:.1f} B/s, "
+              f"streaming frame ({frame_sender.payload_mode}, stima) {frame_mode_bytes / elapsed:.1f} B/s "
+              f"({frame_mode_bytes / max(event_bytes, 1):.0f}x)")
+        if self.latencies:
+            latencies_ms = np.array(self.latencies) * 1000
+            print(f"Latenza gesto -> attuazione: media {latencies_ms.mean():.1f} ms, "
+                  f"p95 {np.percentile(latencies_ms, 95):.1f} ms su {len(latencies_ms)} eventi")
+        if self.frame_latencies:
+            # Codifica + trasferimento + inferenza e risposta dell'ESP32 per i frame di misura
+            frame_latencies_ms = np.array(self.frame_latencies) * 1000
+            print(f"Latenza gesto -> attuazione, streaming frame ({frame_sender.payload_mode}): "
+                  f"media {frame_latencies_ms.mean():.1f} ms, p95 {np.percentile(frame_latencies_ms, 95):.1f} ms "
+                  f"su {len(frame_latencies_ms)} frame di misura")
+
+
+def preprocess_frame(frame, target_height, target_width, input_detail):
+    """Pre-elabora un frame come in test_tflite_model.py e lo porta nel tipo di input del modello."""
+    img_resized = cv2.resize(frame, (target_width, target_height))
+    img_gray = cv2.cvtColor(img_resized, cv2.COLOR_BGR2GRAY)
+    img_normalized = np.expand_dims(img_gray, axis=(0, -1)).astype(np.float32) / 255.0
+    return model_runtime.from_float(img_normalized, input_detail)
+
+
+def predict(interpreter, input_detail, output_detail, input_data):
+    """Esegue il modello e restituisce (classe predetta, confidenza)."""
+    interpreter.set_tensor(input_detail['index'], input_data)
+    interpreter.invoke()
+    output = model_runtime.to_float(interpreter.get_tensor(output_detail['index'])[0], output_detail)
+    predicted_class_index = int(np.argmax(output))
+    return predicted_class_index, float(output[predicted_class_index])
+
+
+def main():
+    global stop_program_flag
+    signal.signal(signal.SIGINT, signal_handler_function)
+
+    try:
+        class_names, img_height, img_width = model_runtime.load_model_metadata(tflite_model_path,
+                                                                               preprocessed_data_file)
+        interpreter_class, backend = model_runtime.load_interpreter_class()
+        interpreter = interpreter_class(model_path=tflite_model_path)
+        interpreter.allocate_tensors()
+    except (FileNotFoundError, ValueError, KeyError) as e:
+        print(f"ERRORE durante il caricamento del modello o dei metadati da '{model_dir}': {e}")
+        sys.exit(1)
+    input_detail = interpreter.get_input_details()[0]
+    output_detail = interpreter.get_output_details()[0]
+    print(f"Modello TFLite caricato ({backend}). Classi: {class_names}")
+
+    stand_in_server = None
+    host, port = esp32_stream_host, esp32_stream_port
+    if use_stand_in_server:
+        stand_in_server = StandInServer().start()
+        host, port = stand_in_server.host, stand_in_server.port
+        print(f"Usato server locale che simula l'ESP32 su {host}:{port}")
+
+    stats = GestureEventStats()
+    try:
+        stream_client = StreamClient(host, port, on_result=stats.on_result)
+    except OSError as e:
+        print(f"ERRORE: Impossibile aprire la connessione di streaming con l'ESP32 ({host}:{port}): {e}")
+        sys.exit(1)
+
+    video_capture = cv2.VideoCapture(rtsp_url)
+    if not video_capture.isOpened():
+        print(f"ERRORE: Impossibile connettersi allo stream RTSP all'URL: {rtsp_url}")
+        stream_client.close()
+        sys.exit(1)
+
+    print(f"Connesso allo stream RTSP: {rtsp_url}. Eventi inviati a {host}:{port}")
+    print("Premi Ctrl+C nel terminale per uscire.")
+
+    last_class_index = None
+    last_confident = False
+    last_report_time = time.perf_counter()
+
+    while not stop_program_flag:
+        success, frame_data = video_capture.read()
+        capture_time = time.perf_counter()
+        if not success:
+            print("Impossibile leggere il frame dallo stream. Potrebbe essere terminato o c'è un problema di connessione.")
+            time.sleep(0.5)
+            continue
+
+        input_data = preprocess_frame(frame_data, img_height, img_width, input_detail)
+        class_index, confidence = predict(interpreter, input_detail, output_detail, input_data)
+
+        # Evento se la classe cambia o se la confidenza attraversa la soglia (in un verso o nell'altro)
+        confident = confidence >= event_confidence_threshold
+        if class_index != last_class_index or confident != last_confident:
+            timestamp_ms = int(time.time() * 1000)
+            try:
+                # L'id viene registrato prima dell'invio, così la conferma non può arrivare prima
+                stream_client.send_event(class_index, confidence, timestamp_ms,
+                                         on_id=lambda event_id: stats.expect(event_id, capture_time))
+            except (ConnectionError, OSError) as e:
+                print(f"ERRORE: Connessione di streaming con l'ESP32 interrotta: {e}")
+                break
+            print(f"Evento inviato: {class_names[class_index]} ({confidence * 100:.1f}%)")
+            last_class_index = class_index
+            last_confident = confident
+
+        # Dopo l'invio dell'evento, così la misura della modalità a frame non pesa sulla latenza degli eventi
+        try:
+            stats.add_frame(frame_data, stream_client)
+        except (ConnectionError, OSError) as e:
+            print(f"ERRORE: Connessione di streaming con l'ESP32 interrotta: {e}")
+            break
+
+        if time.perf_counter() - last_report_time >= report_interval:
+            stats.report(stream_client.bytes_sent)
+            last_report_time = time.perf_counter()
+
+    print("\nRilascio risorse...")
+    stream_client.wait_idle(timeout=1.0)
+    stats.report(stream_client.bytes_sent)
+    stream_client.close()
+    if stand_in_server is not None:
+        stand_in_server.stop()
+    video_capture.release()
+    print("Programma terminato.")
+
+
+if __name__ == '__main__':
+    main()
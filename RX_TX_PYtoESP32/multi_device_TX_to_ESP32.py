@@ -0,0 +1,285 @@
+import cv2
+import time
+import signal
+import sys
+import queue
+import threading
+from collections import deque
+from urllib.parse import urlparse
+import numpy as np
+import requests
+import frame_TX_to_ESP32 as frame_sender
+from stream_protocol import StreamClient
+
+# --- Configurazione Essenziale ---
+# Un solo processo legge lo stream RTSP e codifica ogni frame una volta (formato scelto in
+# frame_TX_to_ESP32.py: payload_mode, jpeg_quality, ...), poi lo consegna in parallelo a tutte le schede.
+rtsp_url = "rtsp://localhost:8554/webcam_stream"
+
+# Elenco delle schede: "http://..." (o "https://...") usa una POST per frame, "tcp://host:porta" la connessione di streaming.
+# max_fps:    frame al secondo massimi inviati alla scheda (0 = nessun limite)
+# timeout:    secondi massimi per una singola consegna
+# queue_size: frame in attesa per la scheda; se è piena si scarta il più vecchio, così una scheda lenta
+#             riceve sempre il frame più recente e non rallenta le altre
+esp32_devices = [
+    {"name": "esp32_1", "url": "http://192.168.217.67:80/upload_frame", "max_fps": 10, "timeout": 3, "queue_size": 2},
+    {"name": "esp32_2", "url": "tcp://192.168.217.68:3333", "max_fps": 10, "timeout": 3, "queue_size": 2},
+]
+
+# Dopo questo numero di errori consecutivi la scheda è considerata offline e si riprova dopo offline_retry_interval.
+# Con "tcp://" anche l'attesa di un credito oltre il timeout conta come errore (scheda connessa ma bloccata).
+max_consecutive_errors = 3
+offline_retry_interval = 5.0
+# Ogni quanti secondi stampare le statistiche per scheda
+report_interval = 5.0
+# --- Fine Configurazione Essenziale ---
+
+HEALTH_OK = "ok"
+HEALTH_DEGRADED = "degradata"
+HEALTH_OFFLINE = "offline"
+
+
+# --- Gestione Uscita con Ctrl+C ---
+stop_program_flag = False
+
+def signal_handler_function(sig, frame_signal):
+    print("\nSegnale di interruzione (Ctrl+C) ricevuto. Uscita in corso...")
+    global stop_program_flag
+    stop_program_flag = True
+# --- Fine Gestione Uscita con Ctrl+C ---
+
+
+class DeviceWorker(threading.Thread):
+    """
+    Consegna i payload (frame o eventi) a una singola scheda con coda, limite di frequenza,
+    timeout e stato di salute propri, in modo che una scheda lenta o spenta non blocchi le altre.
+    """
+
+    def __init__(self, name, url, max_fps=0, timeout=3, queue_size=2):
+        super().__init__(name=name, daemon=True)
+        self.device_name = name
+        self.url = url
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.running = True
+
+        # L'URL viene validato subito: un trasporto non valido deve fermare l'avvio, non il thread a metà
+        parsed = urlparse(url)
+        if parsed.scheme in ("http", "https"):
+            self.transport = "http"
+        elif parsed.scheme == "tcp":
+            if parsed.hostname is None or parsed.port is None:
+                raise ValueError(f"scheda '{name}': l'URL '{url}' deve indicare host e porta (tcp://host:porta)")
+            self.transport = "tcp"
+        else:
+            raise ValueError(f"scheda '{name}': schema '{parsed.scheme}' non supportato in '{url}' "
+                             f"(usa http://, https:// oppure tcp://host:porta)")
+        self.stream_address = (parsed.hostname, parsed.port)
+        self.session = requests.Session() if self.transport == "http" else None  # Connessione keep-alive
+        self.stream_client = None
+
+        self.health = HEALTH_OK
+        self.consecutive_errors = 0
+        self.offline_since = 0.0
+        self.last_send_time = 0.0
+
+        self.stats_lock = threading.Lock()
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.latencies = deque(maxlen=500)
+        self.start_time = time.perf_counter()
+
+    def submit(self, payload, content_type):
+        """Accoda un payload senza mai bloccare: se la coda è piena scarta il più vecchio."""
+        if self.health == HEALTH_OFFLINE and time.perf_counter() - self.offline_since < offline_retry_interval:
+            with self.stats_lock:
+                self.dropped += 1
+            return
+        while True:
+            try:
+                self.queue.put_nowait((payload, content_type))
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    with self.stats_lock:
+                        self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def run(self):
+        while self.running:
+            try:
+                payload, content_type = self.queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+
+            # Limite di frequenza: attende il prossimo slot disponibile per questa scheda
+            wait = self.last_send_time + self.min_interval - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            self.last_send_time = time.perf_counter()
+
+            try:
+                if self._deliver(payload, content_type):
+                    self._mark_success()
+            except (requests.exceptions.RequestException, ConnectionError, OSError) as e:
+                self._mark_failure(e)
+        self._close_transport()
+
+    def _deliver(self, payload, content_type):
+        """
+        Invia il payload con il trasporto configurato e registra la latenza.
+        Restituisce True se la consegna è già confermata (HTTP); con "tcp" la conferma arriva con il risultato
+        (_on_stream_result), così una scheda che accetta i frame ma non risponde non risulta mai "ok".
+        """
+        if self.transport == "tcp":
+            if self.stream_client is None:
+                self.stream_client = StreamClient(*self.stream_address, connect_timeout=self.timeout,
+                                                  on_result=self._on_stream_result, send_timeout=self.timeout)
+            # Attende un credito al massimo 'timeout' secondi; la latenza arriva in modo asincrono.
+            # Se la scheda tiene aperta la connessione ma non restituisce crediti, è un errore di consegna;
+            # lo stesso vale per una scrittura bloccata oltre 'timeout' (TimeoutError da StreamClient)
+            if self.stream_client.send_frame(payload, wait_timeout=self.timeout) is None:
+                raise TimeoutError(f"nessun credito ricevuto entro {self.timeout} s")
+            with self.stats_lock:
+                self.sent += 1
+                self.bytes_sent += len(payload)
+            return False
+
+        start_time = time.perf_counter()
+        response = self.session.post(self.url, data=payload, headers={'Content-Type': content_type},
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        with self.stats_lock:
+            self.sent += 1
+            self.bytes_sent += len(payload)
+            self.latencies.append(time.perf_counter() - start_time)
+        return True
+
+    def _on_stream_result(self, frame_id, result, latency):
+        """Callback del thread di ricezione dello streaming: la scheda ha elaborato il frame."""
+        if latency is not None:
+            with self.stats_lock:
+                self.latencies.append(latency)
+        self._mark_success()
+
+    def _mark_success(self):
+        if self.health != HEALTH_OK:
+            print(f"[{self.device_name}] Scheda di nuovo raggiungibile.")
+        self.health = HEALTH_OK
+        self.consecutive_errors = 0
+
+    def _mark_failure(self, error):
+        with self.stats_lock:
+            self.errors += 1
+        self.consecutive_errors += 1
+        self._close_transport()
+        if self.consecutive_errors >= max_consecutive_errors:
+            if self.health != HEALTH_OFFLINE:
+                print(f"[{self.device_name}] Scheda offline dopo {self.consecutive_errors} errori: {error}")
+            self.health = HEALTH_OFFLINE
+            self.offline_since = time.perf_counter()
+            # I frame accumulati sarebbero comunque vecchi al prossimo tentativo
+            while not self.queue.empty():
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+        else:
+            self.health = HEALTH_DEGRADED
+            print(f"[{self.device_name}] ERRORE di consegna: {error}")
+
+    def _close_transport(self):
+        if self.stream_client is not None:
+            self.stream_client.close()
+            self.stream_client = None
+
+    def stats(self):
+        """Restituisce un dizionario con le statistiche correnti della scheda."""
+        with self.stats_lock:
+            elapsed = max(time.perf_counter() - self.start_time, 1e-6)
+            latencies_ms = np.array(self.latencies) * 1000
+            return {
+                'name': self.device_name,
+                'health': self.health,
+                'sent': self.sent,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'fps': self.sent / elapsed,
+                'bytes_per_second': self.bytes_sent / elapsed,
+                'latency_mean_ms': latencies_ms.mean() if len(latencies_ms) else float('nan'),
+                'latency_p95_ms': np.percentile(latencies_ms, 95) if len(latencies_ms) else float('nan'),
+            }
+
+    def stop(self):
+        self.running = False
+
+
+def print_stats(workers):
+    """Stampa le statistiche di throughput e latenza di ogni scheda."""
+    print(f"{'Scheda':<12} {'Stato':<10} {'Inviati':>8} {'Scartati':>8} {'Errori':>7} {'Frame/s':>8} "
+          f"{'KB/s':>8} {'Lat. media':>11} {'Lat. p95':>9}")
+    for worker in workers:
+        s = worker.stats()
+        print(f"{s['name']:<12} {s['health']:<10} {s['sent']:>8} {s['dropped']:>8} {s['errors']:>7} {s['fps']:>8.1f} "
+              f"{s['bytes_per_second'] / 1024:>8.1f} {s['latency_mean_ms']:>8.1f} ms {s['latency_p95_ms']:>6.1f} ms")
+
+
+def main():
+    global stop_program_flag
+    signal.signal(signal.SIGINT, signal_handler_function)
+
+    try:
+        workers = [DeviceWorker(d['name'], d['url'], d.get('max_fps', 0), d.get('timeout', 3), d.get('queue_size', 2))
+                   for d in esp32_devices]
+    except ValueError as e:
+        print(f"ERRORE nella configurazione delle schede: {e}")
+        sys.exit(1)
+
+    video_capture = cv2.VideoCapture(rtsp_url)
+    if not video_capture.isOpened():
+        print(f"ERRORE: Impossibile connettersi allo stream RTSP all'URL: {rtsp_url}")
+        sys.exit(1)
+    print(f"Connesso correttamente allo stream RTSP: {rtsp_url}")
+
+    for worker in workers:
+        worker.start()
+        print(f"  Scheda '{worker.device_name}': {worker.url}")
+    print("\nAvvio invio frame. Premi Ctrl+C nel terminale per uscire.")
+
+    last_report_time = time.perf_counter()
+    while not stop_program_flag:
+        success, frame_data = video_capture.read()
+        if not success:
+            print("Impossibile leggere il frame dallo stream. Potrebbe essere terminato o c'è un problema di connessione.")
+            time.sleep(0.5)
+            continue
+
+        # Il frame viene codificato una sola volta e condiviso da tutte le schede
+        encoded = frame_sender.encode_payload(frame_data)
+        if encoded is None:
+            print("ERRORE: Durante la codifica del frame.")
+            continue
+        for worker in workers:
+            worker.submit(*encoded)
+
+        if time.perf_counter() - last_report_time >= report_interval:
+            print_stats(workers)
+            last_report_time = time.perf_counter()
+
+    print("\nRilascio risorse...")
+    for worker in workers:
+        worker.stop()
+    for worker in workers:
+        worker.join(timeout=2)
+    print_stats(workers)
+    video_capture.release()
+    print("Programma terminato.")
+
+
+if __name__ == '__main__':
+    main()
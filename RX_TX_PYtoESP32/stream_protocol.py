@@ -0,0 +1,270 @@
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+# --- Protocollo di streaming binario PC <-> ESP32 ---
+# Una sola connessione TCP persistente al posto di una richiesta HTTP per frame.
+# Ogni messaggio è: tipo u8 | lunghezza u32 (little-endian) | dati
+#   MSG_FRAME  (PC -> ESP32): id frame u32 | payload (JPEG o tensore, vedi frame_TX_to_ESP32.py)
+#   MSG_RESULT (ESP32 -> PC): id frame u32 | risultato dell'inferenza (testo UTF-8)
+#   MSG_CREDIT (ESP32 -> PC): numero di crediti concessi u16
+#   MSG_EVENT  (PC -> ESP32): id evento u32 | classe u8 | confidenza f32 | timestamp ms u64
+#              (inferenza eseguita sul PC, vedi gesture_events_TX_to_ESP32.py); l'ESP32 conferma
+#              l'attuazione con un MSG_RESULT con lo stesso id. Gli eventi non consumano crediti.
+#
+# Controllo di flusso a crediti: l'ESP32 concede all'avvio tanti crediti quanti frame può tenere in coda
+# e ne restituisce uno ogni volta che finisce di elaborare un frame. Il PC invia un frame solo se ha
+# almeno un credito, quindi non riempie mai i buffer del dispositivo.
+MESSAGE_HEADER_FORMAT = "<BI"
+MESSAGE_HEADER_SIZE = struct.calcsize(MESSAGE_HEADER_FORMAT)
+FRAME_ID_FORMAT = "<I"
+FRAME_ID_SIZE = struct.calcsize(FRAME_ID_FORMAT)
+CREDIT_FORMAT = "<H"
+EVENT_FORMAT = "<IBfQ"
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
+
+MSG_FRAME = 0x01
+MSG_RESULT = 0x02
+MSG_CREDIT = 0x03
+MSG_EVENT = 0x04
+
+DEFAULT_STREAM_PORT = 3333
+# Tempo massimo (secondi) per scrivere un messaggio: una scheda che smette di leggere non deve bloccare
+# per sempre chi invia. Il timeout del socket vale anche in lettura, dove viene semplicemente ignorato.
+DEFAULT_SEND_TIMEOUT = 3.0
+# Messaggi in attesa di risultato tenuti in memoria: oltre questo limite si scarta il più vecchio
+# (un risultato mai arrivato non deve far crescere 'pending' senza fine)
+MAX_PENDING_MESSAGES = 256
+# --- Fine Protocollo ---
+
+
+def pack_message(msg_type, data):
+    """Costruisce un messaggio con header tipo/lunghezza."""
+    return struct.pack(MESSAGE_HEADER_FORMAT, msg_type, len(data)) + data
+
+
+def recv_exact(sock, size):
+    """Legge esattamente 'size' byte dal socket; restituisce None se la connessione viene chiusa."""
+    buffer = bytearray()
+    while len(buffer) < size:
+        try:
+            chunk = sock.recv(size - len(buffer))
+        except socket.timeout:
+            continue  # Nessun dato per ora: in lettura si attende senza limite, il messaggio resta integro
+        if not chunk:
+            return None
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def recv_message(sock):
+    """Legge un messaggio completo. Restituisce (tipo, dati) oppure None a connessione chiusa."""
+    header = recv_exact(sock, MESSAGE_HEADER_SIZE)
+    if header is None:
+        return None
+    msg_type, length = struct.unpack(MESSAGE_HEADER_FORMAT, header)
+    data = recv_exact(sock, length) if length > 0 else b""
+    if data is None:
+        return None
+    return msg_type, data
+
+
+class StreamClient:
+    """
+    Client lato PC: invia i frame sulla connessione persistente e riceve in modo asincrono
+    (thread dedicato) i risultati dell'inferenza e i crediti restituiti dall'ESP32.
+    """
+
+    def __init__(self, host, port=DEFAULT_STREAM_PORT, connect_timeout=3, on_result=None,
+                 send_timeout=DEFAULT_SEND_TIMEOUT):
+        self.sock = socket.create_connection((host, port), timeout=connect_timeout)
+        self.sock.settimeout(send_timeout)
+        self.send_timeout = send_timeout
+        # Disattiva Nagle: i frame devono partire subito, non essere accorpati
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.on_result = on_result
+
+        self.credits = 0
+        self.credit_condition = threading.Condition()
+        self.send_lock = threading.Lock()
+        self.next_frame_id = 0
+        self.pending = {}  # id frame -> istante di invio (in ordine di invio, al massimo MAX_PENDING_MESSAGES)
+        self.pending_lock = threading.Lock()
+        self.connected = True
+
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.results_lost = 0  # Messaggi scartati da 'pending' senza aver ricevuto il risultato
+        self.bytes_sent = 0
+        self.latencies = deque(maxlen=1000)
+
+        self.reader_thread = threading.Thread(target=self._reader_loop, daemon=True)
+        self.reader_thread.start()
+
+    def _reader_loop(self):
+        """Riceve crediti e risultati finché la connessione resta aperta."""
+        try:
+            while True:
+                message = recv_message(self.sock)
+                if message is None:
+                    break
+                msg_type, data = message
+                if msg_type == MSG_CREDIT:
+                    (granted,) = struct.unpack(CREDIT_FORMAT, data)
+                    with self.credit_condition:
+                        self.credits += granted
+                        self.credit_condition.notify_all()
+                elif msg_type == MSG_RESULT:
+                    (frame_id,) = struct.unpack(FRAME_ID_FORMAT, data[:FRAME_ID_SIZE])
+                    with self.pending_lock:
+                        sent_time = self.pending.pop(frame_id, None)
+                    latency = time.perf_counter() - sent_time if sent_time is not None else None
+                    if latency is not None:
+                        self.latencies.append(latency)
+                    if self.on_result is not None:
+                        self.on_result(frame_id, data[FRAME_ID_SIZE:].decode('utf-8', errors='replace'), latency)
+        except OSError:
+            pass
+        finally:
+            with self.credit_condition:
+                self.connected = False
+                self.credit_condition.notify_all()
+
+    def send_frame(self, payload, wait_timeout=0.0, on_id=None):
+        """
+        Invia un frame se c'è almeno un credito (attendendo al massimo 'wait_timeout' secondi).
+        Restituisce l'id del frame, oppure None se il frame viene scartato per mancanza di crediti.
+        'on_id(frame_id)' viene chiamata prima dell'invio, come in send_event().
+        Solleva ConnectionError se la connessione è stata chiusa.
+        """
+        with self.credit_condition:
+            if self.credits == 0 and wait_timeout > 0:
+                self.credit_condition.wait_for(lambda: self.credits > 0 or not self.connected, timeout=wait_timeout)
+            if not self.connected:
+                raise ConnectionError("Connessione di streaming con l'ESP32 chiusa.")
+            if self.credits == 0:
+                # Per un flusso video è meglio scartare il frame che accumulare ritardo
+                self.frames_dropped += 1
+                return None
+            self.credits -= 1
+
+        frame_id = self._send_with_id(lambda frame_id: pack_message(
+            MSG_FRAME, struct.pack(FRAME_ID_FORMAT, frame_id) + payload), on_id)
+        self.frames_sent += 1
+        return frame_id
+
+    def send_event(self, class_index, confidence, timestamp_ms, on_id=None):
+        """
+        Invia un evento di gesto (non richiede crediti). Restituisce l'id dell'evento.
+        'on_id(event_id)' viene chiamata prima dell'invio: chi attende la conferma può registrare l'id
+        senza tenere un lock durante l'I/O di rete.
+        """
+        if not self.connected:
+            raise ConnectionError("Connessione di streaming con l'ESP32 chiusa.")
+        return self._send_with_id(lambda event_id: pack_message(
+            MSG_EVENT, struct.pack(EVENT_FORMAT, event_id, class_index, confidence, timestamp_ms)), on_id)
+
+    def _send_with_id(self, build_message, on_id=None):
+        """Assegna un id (comune a frame ed eventi), registra l'istante di invio e spedisce il messaggio."""
+        with self.send_lock:
+            message_id = self.next_frame_id
+            self.next_frame_id = (self.next_frame_id + 1) & 0xFFFFFFFF
+            message = build_message(message_id)
+            with self.pending_lock:
+                if len(self.pending) >= MAX_PENDING_MESSAGES:
+                    del self.pending[next(iter(self.pending))]
+                    self.results_lost += 1
+                self.pending[message_id] = time.perf_counter()
+            if on_id is not None:
+                on_id(message_id)
+            try:
+                self.sock.sendall(message)
+            except socket.timeout:
+                # Il messaggio può essere stato scritto a metà: la connessione non è più utilizzabile
+                self._abort()
+                raise TimeoutError(f"invio non completato entro {self.send_timeout} s (la scheda non legge)")
+            self.bytes_sent += len(message)
+        return message_id
+
+    def wait_idle(self, timeout=5.0):
+        """Attende che tutti i frame inviati abbiano ricevuto un risultato."""
+        deadline = time.perf_counter() + timeout
+        while self.pending and self.connected and time.perf_counter() < deadline:
+            time.sleep(0.001)
+        return not self.pending
+
+    def _abort(self):
+        """Interrompe la connessione; il thread di ricezione termina e segna connected = False."""
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        """Chiude la connessione e attende la fine del thread di ricezione."""
+        self._abort()
+        self.sock.close()
+        self.reader_thread.join(timeout=1)
+
+
+class StandInServer:
+    """
+    Server locale che simula l'ESP32 (per test e benchmark senza hardware):
+    concede 'initial_credits' crediti, "elabora" ogni frame in 'processing_time' secondi,
+    risponde con un MSG_RESULT e restituisce il credito.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, initial_credits=4, processing_time=0.0):
+        self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_sock.bind((host, port))
+        self.server_sock.listen(1)
+        self.host, self.port = self.server_sock.getsockname()
+        self.initial_credits = initial_credits
+        self.processing_time = processing_time
+        self.frames_received = 0
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _serve(self):
+        while True:
+            try:
+                client, _ = self.server_sock.accept()
+            except OSError:
+                break  # Server chiuso
+            with client:
+                client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self._handle_client(client)
+
+    def _handle_client(self, client):
+        try:
+            client.sendall(pack_message(MSG_CREDIT, struct.pack(CREDIT_FORMAT, self.initial_credits)))
+            while True:
+                message = recv_message(client)
+                if message is None:
+                    break
+                msg_type, data = message
+                if msg_type == MSG_EVENT:
+                    event_id, class_index, confidence, _ = struct.unpack(EVENT_FORMAT, data[:EVENT_SIZE])
+                    result = f"Attuato gesto {class_index} ({confidence * 100:.1f}%)".encode('utf-8')
+                    client.sendall(pack_message(MSG_RESULT, struct.pack(FRAME_ID_FORMAT, event_id) + result))
+                    continue
+                if msg_type != MSG_FRAME:
+                    continue
+                if self.processing_time > 0:
+                    time.sleep(self.processing_time)
+                self.frames_received += 1
+                frame_id = data[:FRAME_ID_SIZE]
+                result = f"Frame ricevuto: {len(data) - FRAME_ID_SIZE} byte".encode('utf-8')
+                client.sendall(pack_message(MSG_RESULT, frame_id + result) +
+                               pack_message(MSG_CREDIT, struct.pack(CREDIT_FORMAT, 1)))
+        except OSError:
+            pass
+
+    def stop(self):
+        self.server_sock.close()